@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Medição de desempenho do renderizador sem janela sobre os exemplos X3D.
+
+Desenvolvido por: Edgard Ortiz Neto
+Disciplina: Computação Gráfica
+Data: 18 de outubro de 2026
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+
+import numpy as np
+
+from exemplos import TESTE  # Mesma lista de cenas usada pelo carregador de exemplos
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(RAIZ, "renderizador"))
+
+import gl            # pylint: disable=wrong-import-position
+import gpu           # pylint: disable=wrong-import-position
+import x3d           # pylint: disable=wrong-import-position
+import paralelo      # pylint: disable=wrong-import-position
+import renderizador  # pylint: disable=wrong-import-position
+
+FASES = ("parse", "setup", "traversal", "resolve", "save")
+
+
+def opcoes(exemplo):
+    """Recupera o arquivo e a resolução de uma entrada da lista de exemplos."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-i", "--input")
+    parser.add_argument("-w", "--width", type=int, default=renderizador.LARGURA)
+    parser.add_argument("-h", "--height", type=int, default=renderizador.ALTURA)
+    args, _ = parser.parse_known_args(exemplo[1:])
+    return os.path.join(RAIZ, args.input), args.width, args.height
+
+
+def medir(x3d_file, width, height, image_file, jobs=1):
+    """Renderiza a cena uma vez retornando o tempo de cada fase, os triângulos desenhados e as
+    formas descartadas pelo recorte do campo de visão. Com jobs > 1 o quadro é dividido em
+    faixas renderizadas por processos (criados no setup, fora do tempo do quadro)."""
+    tempos = {}
+
+    inicio = time.perf_counter()
+    gpu.GPU(image_file, os.path.dirname(x3d_file))
+    x3d.X3DNode.named_nodes = {}
+    render = renderizador.Renderizador()
+    render.x3d_file = x3d_file
+    render.image_file = image_file
+    render.width = width
+    render.height = height
+    render.jobs = jobs
+    render.scene = x3d.X3D(x3d_file)
+    render.mapping()
+    render.scene.parse()
+    tempos["parse"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    render.setup()
+    render.setup_gl()
+    if jobs > 1:
+        render.paralelo = paralelo.Paralelo(render.scene, jobs)
+    tempos["setup"] = time.perf_counter() - inicio
+
+    try:
+        inicio = time.perf_counter()
+        gl.GL.triangles = 0
+        gl.GL.culled = 0
+        render.pre()
+        if render.paralelo:
+            render.paralelo.render()
+        else:
+            render.scene.render()
+            gl.GL.deferredLighting()  # ilumina o G-buffer (somente no shading deferred)
+        tempos["traversal"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        render.pos()
+        tempos["resolve"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        gpu.GPU.save_image()
+        gpu.GPU.flush_images()  # inclui a gravação feita em segundo plano
+        tempos["save"] = time.perf_counter() - inicio
+    finally:
+        if render.paralelo:
+            render.paralelo.close()
+
+    return tempos, gl.GL.triangles, gl.GL.culled
+
+
+def benchmark(exemplo, iteracoes, pasta, jobs=1):
+    """Mede um exemplo por algumas iterações e resume os tempos."""
+    x3d_file, width, height = opcoes(exemplo)
+    image_file = os.path.join(pasta, exemplo[0] + ".png")
+
+    medidas = []
+    triangulos = descartadas = 0
+    # As rotinas ainda não implementadas imprimem seus parâmetros, o que não interessa aqui
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        for _ in range(iteracoes):
+            tempos, triangulos, descartadas = medir(x3d_file, width, height, image_file, jobs)
+            medidas.append(tempos)
+
+    fases = {}
+    for fase in FASES:
+        valores = np.array([medida[fase] for medida in medidas])
+        fases[fase] = {"mean": valores.mean(), "min": valores.min(), "max": valores.max()}
+
+    # Desempenho considerando o tempo de um quadro (percurso da cena mais a redução do SSAA)
+    quadro = fases["traversal"]["mean"] + fases["resolve"]["mean"]
+    return {
+        "file": os.path.relpath(x3d_file, RAIZ),
+        "width": width,
+        "height": height,
+        "triangles": triangulos,
+        "culled": descartadas,
+        "phases": fases,
+        "frame": quadro,
+        "pixels_per_second": width * height / quadro if quadro else None,
+        "triangles_per_second": triangulos / fases["traversal"]["mean"] if triangulos else None,
+    }
+
+
+def main():
+    """Roda o benchmark conforme os parâmetros da linha de comando."""
+    parser = argparse.ArgumentParser(description="Benchmark do renderizador sem janela.")
+    parser.add_argument("exemplos", nargs="*", help="nomes dos exemplos (padrão: todos)")
+    parser.add_argument("-n", "--iterations", help="iterações por exemplo", type=int, default=3)
+    parser.add_argument("-o", "--output", help="arquivo JSON com os resultados")
+    parser.add_argument("-e", "--engine", help="motor de rasterização", choices=gl.GL.ENGINES,
+                        default=gl.GL.ENGINE)
+    parser.add_argument("--shading", help="modo de iluminação", choices=gl.GL.SHADINGS,
+                        default=gl.GL.SHADING)
+    parser.add_argument("-j", "--jobs", help="processos para renderização paralela", type=int,
+                        default=1)
+    args = parser.parse_args()
+    gl.GL.ENGINE = args.engine
+    gl.GL.SHADING = args.shading
+
+    escolhidos = [exemplo for exemplo in TESTE if not args.exemplos or exemplo[0] in args.exemplos]
+    if not escolhidos:
+        sys.exit("Nenhum exemplo encontrado!")
+
+    resultados = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "iterations": args.iterations,
+        "engine": args.engine,
+        "shading": args.shading,
+        "jobs": args.jobs,
+        "ssaa": [renderizador.Renderizador.scale_x, renderizador.Renderizador.scale_y]
+                if renderizador.Renderizador.SSAA else [1, 1],
+        "scenes": {},
+    }
+
+    print("{0:12} {1:>9} {2:>9} ".format("exemplo", "triâng.", "descart.") +
+          " ".join("{0:>9}".format(fase) for fase in FASES) +
+          " {0:>10} {1:>10}".format("pixels/s", "triâng./s"))
+    with tempfile.TemporaryDirectory() as pasta:
+        for exemplo in escolhidos:
+            resultado = benchmark(exemplo, args.iterations, pasta, args.jobs)
+            resultados["scenes"][exemplo[0]] = resultado
+            print("{0:12} {1:>9} {2:>9} ".format(exemplo[0], resultado["triangles"], resultado["culled"]) +
+                  " ".join("{0:>8.4f}s".format(resultado["phases"][fase]["mean"]) for fase in FASES) +
+                  " {0:>10.3g} {1:>10.3g}".format(resultado["pixels_per_second"] or 0,
+                                                 resultado["triangles_per_second"] or 0),
+                  flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+        print("Resultados salvos em: {0}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Comparação das imagens e tempos de dois backends de renderização sobre os exemplos X3D.
+
+Desenvolvido por: Edgard Ortiz Neto
+Disciplina: Computação Gráfica
+Data: 18 de outubro de 2026
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+import numpy as np
+
+from exemplos import TESTE    # Mesma lista de cenas usada pelo carregador de exemplos
+from benchmark import opcoes  # Arquivo e resolução de cada exemplo
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(RAIZ, "renderizador"))
+
+import gl            # pylint: disable=wrong-import-position
+import gpu           # pylint: disable=wrong-import-position
+import x3d           # pylint: disable=wrong-import-position
+import backends      # pylint: disable=wrong-import-position
+import renderizador  # pylint: disable=wrong-import-position
+
+
+def renderizar(x3d_file, width, height, backend, iteracoes, instante=0.0):
+    """Renderiza a cena com o backend retornando a imagem e o menor tempo de um quadro."""
+    gpu.GPU("tela.png", os.path.dirname(x3d_file))
+    x3d.X3DNode.named_nodes = {}
+    render = renderizador.Renderizador()
+    render.backend = backend
+    render.x3d_file = x3d_file
+    render.width = width
+    render.height = height
+    render.scene = x3d.X3D(x3d_file)
+    render.mapping()
+    render.scene.parse()
+    render.setup()
+    render.setup_gl()
+
+    # Os dois backends desenham as animações no mesmo instante, com os eventos já propagados
+    gl.GL.frame_time = instante
+    render.scene.update()
+
+    tempos = []
+    for _ in range(iteracoes):
+        inicio = time.perf_counter()
+        imagem = render.render()
+        tempos.append(time.perf_counter() - inicio)
+    return np.array(imagem), min(tempos)
+
+
+def comparar(exemplo, backend_a, backend_b, iteracoes, instante=0.0):
+    """Renderiza um exemplo com os dois backends e compara as imagens pixel a pixel."""
+    x3d_file, width, height = opcoes(exemplo)
+    # As rotinas ainda não implementadas imprimem seus parâmetros, o que não interessa aqui
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        imagem_a, tempo_a = renderizar(x3d_file, width, height, backend_a, iteracoes, instante)
+        imagem_b, tempo_b = renderizar(x3d_file, width, height, backend_b, iteracoes, instante)
+
+    diferenca = np.abs(imagem_a.astype(int) - imagem_b.astype(int)).max(axis=2)
+    return {
+        "file": os.path.relpath(x3d_file, RAIZ),
+        "width": width,
+        "height": height,
+        "different_pixels": int(np.count_nonzero(diferenca)),
+        "max_difference": int(diferenca.max()),
+        "time": {backend_a: tempo_a, backend_b: tempo_b},
+    }
+
+
+def main():
+    """Roda a comparação conforme os parâmetros da linha de comando."""
+    parser = argparse.ArgumentParser(description="Conformidade entre dois backends de renderização.")
+    parser.add_argument("exemplos", nargs="*", help="nomes dos exemplos (padrão: todos)")
+    parser.add_argument("-a", "--backend-a", help="backend de referência", default="gl",
+                        choices=list(backends.BACKENDS))
+    parser.add_argument("-b", "--backend-b", help="backend comparado", default="scanline",
+                        choices=list(backends.BACKENDS))
+    parser.add_argument("-n", "--iterations", help="renderizações de cada exemplo por backend",
+                        type=int, default=1)
+    parser.add_argument("-t", "--tolerance", help="diferença máxima aceita em cada canal (0 a 255)",
+                        type=int, default=0)
+    parser.add_argument("--time", help="instante das animações em segundos (padrão: 0)",
+                        type=float, default=0.0)
+    parser.add_argument("-o", "--output", help="arquivo JSON com os resultados")
+    args = parser.parse_args()
+
+    escolhidos = [exemplo for exemplo in TESTE if not args.exemplos or exemplo[0] in args.exemplos]
+    if not escolhidos:
+        sys.exit("Nenhum exemplo encontrado!")
+
+    a, b = args.backend_a, args.backend_b
+    print("{0:12} {1:>9} {2:>6} {3:>10} {4:>10} {5:>7}".format(
+        "exemplo", "pixels", "máx.", a[:10], b[:10], "razão"))
+    resultados = {"backends": [a, b], "tolerance": args.tolerance, "time": args.time, "scenes": {}}
+    falhas = []
+    for exemplo in escolhidos:
+        resultado = comparar(exemplo, a, b, args.iterations, args.time)
+        resultados["scenes"][exemplo[0]] = resultado
+        if resultado["max_difference"] > args.tolerance:
+            falhas.append(exemplo[0])
+        tempo_a, tempo_b = resultado["time"][a], resultado["time"][b]
+        print("{0:12} {1:>9} {2:>6} {3:>9.4f}s {4:>9.4f}s {5:>7.2f}{6}".format(
+            exemplo[0], resultado["different_pixels"], resultado["max_difference"],
+            tempo_a, tempo_b, tempo_a / tempo_b if tempo_b else 0,
+            "  <- diferente" if exemplo[0] in falhas else ""), flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+        print("Resultados salvos em: {0}".format(args.output))
+
+    if falhas:
+        sys.exit("Exemplos com diferenças acima da tolerância: {0}".format(", ".join(falhas)))
+
+
+if __name__ == "__main__":
+    main()
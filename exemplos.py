@@ -65,42 +65,45 @@ TESTE.append(["piramide", "-i", DIR+"3D/animacoes/piramide.x3d", "-w", "300", "-
 TESTE.append(["leques", "-i", DIR+"3D/cores/leques.x3d", "-w", "480", "-h", "320", "-p"])
 TESTE.append(["flechas", "-i", DIR+"3D/cores/flechas.x3d", "-w", "480", "-h", "320", "-p"])
 
-# Lista os exemplos registrados (em 3 colunas)
-colunas = 4
-t = -(len(TESTE)//-colunas)
-for i in range(t):
-    for j in range(colunas):
-        d = i+j*t
-        if d < len(TESTE):
-            print("{0:2} : {1:15}".format(d, TESTE[d][0]), end="")
-    print()
-
-# Se um parâmetro fornecido, usar ele como escolha do exemplo
-outra_opcoes = []  # caso usuario passe opções que deverão ser repassadas, por exemplo: --quiet
-if len(sys.argv) > 1:
-    escolha = sys.argv[1]
+# Só executa a seleção quando chamado diretamente (a lista TESTE pode ser importada)
+if __name__ == "__main__":
+
+    # Lista os exemplos registrados (em 3 colunas)
+    colunas = 4
+    t = -(len(TESTE)//-colunas)
+    for i in range(t):
+        for j in range(colunas):
+            d = i+j*t
+            if d < len(TESTE):
+                print("{0:2} : {1:15}".format(d, TESTE[d][0]), end="")
+        print()
+
+    # Se um parâmetro fornecido, usar ele como escolha do exemplo
+    outra_opcoes = []  # caso usuario passe opções que deverão ser repassadas, por exemplo: --quiet
     if len(sys.argv) > 1:
-        outra_opcoes = sys.argv[2:]
-else:
-    escolha = input("Escolha o exemplo: ")
-
-# Verifica se a escolha do exemplo foi pelo índice ou primeiro argumento da lista
-if escolha.isnumeric():
-    numero = int(escolha)
-    if 0 <= numero < len(TESTE):
-        opcoes = TESTE[int(escolha)]
+        escolha = sys.argv[1]
+        if len(sys.argv) > 1:
+            outra_opcoes = sys.argv[2:]
     else:
-        sys.exit("Opção inválida!")
-else:
-    opcoes = [element for element in TESTE if element[0] == escolha]
-    if len(opcoes) > 0:    
-        opcoes = opcoes[0]
+        escolha = input("Escolha o exemplo: ")
+
+    # Verifica se a escolha do exemplo foi pelo índice ou primeiro argumento da lista
+    if escolha.isnumeric():
+        numero = int(escolha)
+        if 0 <= numero < len(TESTE):
+            opcoes = TESTE[int(escolha)]
+        else:
+            sys.exit("Opção inválida!")
     else:
-        sys.exit("Opção inválida!")
-
-# Roda renderizador com os parâmetros necessário para o exemplo escolhido
-interpreter = sys.executable
-print('Abrindo arquivo: "{0}"'.format(opcoes[2]))
-print("> ", interpreter, "renderizador/renderizador.py", " ".join(opcoes[1:]), "\n")
-
-subprocess.call([interpreter, "renderizador/renderizador.py"] + opcoes[1:])
+        opcoes = [element for element in TESTE if element[0] == escolha]
+        if len(opcoes) > 0:    
+            opcoes = opcoes[0]
+        else:
+            sys.exit("Opção inválida!")
+
+    # Roda renderizador com os parâmetros necessário para o exemplo escolhido
+    interpreter = sys.executable
+    print('Abrindo arquivo: "{0}"'.format(opcoes[2]))
+    print("> ", interpreter, "renderizador/renderizador.py", " ".join(opcoes[1:]), "\n")
+
+    subprocess.call([interpreter, "renderizador/renderizador.py"] + opcoes[1:])
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Registro das bibliotecas gráficas (backends) que desenham as cenas X3D.
+
+Desenvolvido por: Edgard Ortiz Neto
+Disciplina: Computação Gráfica
+Data: 18 de outubro de 2026
+"""
+
+import gl           # Recupera rotinas de suporte ao X3D
+
+# Rotinas que todo backend deve fornecer para o X3D
+ROTINAS = ("Polypoint2D", "Polyline2D", "TriangleSet2D", "TriangleSet", "Viewpoint",
+           "Transform_in", "Transform_out", "TriangleStripSet", "IndexedTriangleStripSet",
+           "IndexedFaceSet", "Box", "Sphere", "NavigationInfo", "DirectionalLight",
+           "PointLight", "Fog", "TimeSensor", "SplinePositionInterpolator",
+           "OrientationInterpolator")
+
+
+class Backend:
+    """Conjunto de rotinas de renderização que pode ser escolhido para desenhar as cenas.
+
+    renderer : rotinas chamadas pelos nós X3D na renderização (todas as de ROTINAS)
+    compiler : rotinas opcionais que compilam as geometrias durante o parse; se existirem,
+        renderer deve ter também a rotina "Mesh" que desenha as geometrias compiladas
+    options : atributos da classe GL alterados enquanto o backend estiver ativo
+    """
+
+    def __init__(self, name, renderer, compiler=None, options=None):
+        """Verifica se todas as rotinas necessárias foram fornecidas."""
+        required = ROTINAS + (("Mesh",) if compiler else ())
+        missing = [rotina for rotina in required if rotina not in renderer]
+        if missing:
+            raise Exception("Backend {0} não implementa: {1}".format(name, ", ".join(missing)))
+        self.name = name
+        self.renderer = dict(renderer)
+        self.compiler = dict(compiler or {})
+        self.options = dict(options or {})
+
+
+BACKENDS = {}    # backends registrados pelo nome
+ativo = None     # backend ativo
+alterados = {}   # valores originais dos atributos do GL alterados pelo backend ativo
+
+
+def register(backend):
+    """Registra um backend, que pode então ser escolhido pelo nome."""
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+def activate(name, renderer, compiler):
+    """Ativa o backend preenchendo os dicionários de rotinas do X3D."""
+    global ativo, alterados  # pylint: disable=global-statement
+    if name not in BACKENDS:
+        raise Exception("Backend desconhecido: {0} (disponíveis: {1})".format(
+            name, ", ".join(BACKENDS)))
+    backend = BACKENDS[name]
+
+    # As opções do backend anterior são desfeitas antes de aplicar as do novo
+    for option, value in alterados.items():
+        setattr(gl.GL, option, value)
+    alterados = {option: getattr(gl.GL, option) for option in backend.options}
+    for option, value in backend.options.items():
+        setattr(gl.GL, option, value)
+
+    renderer.clear()
+    renderer.update(backend.renderer)
+    compiler.clear()
+    compiler.update(backend.compiler)
+    ativo = backend
+    return backend
+
+
+def gl_backend(name="gl", **options):
+    """Backend com as rotinas da classe GL."""
+    return Backend(name, {
+        "Polypoint2D": gl.GL.polypoint2D,
+        "Polyline2D": gl.GL.polyline2D,
+        "TriangleSet2D": gl.GL.triangleSet2D,
+        "TriangleSet": gl.GL.triangleSet,
+        "Viewpoint": gl.GL.viewpoint,
+        "Transform_in": gl.GL.transform_in,
+        "Transform_out": gl.GL.transform_out,
+        "TriangleStripSet": gl.GL.triangleStripSet,
+        "IndexedTriangleStripSet": gl.GL.indexedTriangleStripSet,
+        "IndexedFaceSet": gl.GL.indexedFaceSet,
+        "Box": gl.GL.box,
+        "Sphere": gl.GL.sphere,
+        "NavigationInfo": gl.GL.navigationInfo,
+        "DirectionalLight": gl.GL.directionalLight,
+        "PointLight": gl.GL.pointLight,
+        "Fog": gl.GL.fog,
+        "TimeSensor": gl.GL.timeSensor,
+        "SplinePositionInterpolator": gl.GL.splinePositionInterpolator,
+        "OrientationInterpolator": gl.GL.orientationInterpolator,
+        "Mesh": gl.GL.drawMesh,
+    }, {
+        # Rotinas que compilam as geometrias em buffers da GPU durante o parse
+        "TriangleSet": gl.GL.compileTriangleSet,
+        "TriangleStripSet": gl.GL.compileTriangleStripSet,
+        "IndexedTriangleStripSet": gl.GL.compileIndexedTriangleStripSet,
+        "IndexedFaceSet": gl.GL.compileIndexedFaceSet,
+        "Box": gl.GL.compileBox,
+        "Sphere": gl.GL.compileSphere,
+    }, options)
+
+
+# Backends disponíveis: o GL com cada motor de rasterização
+register(gl_backend("gl"))
+register(gl_backend("scanline", ENGINE="scanline"))
@@ -12,6 +12,7 @@ Data: 24 de fevereiro de 2023
 """
 
 import time         # Para operações com tempo
+from collections import OrderedDict  # Para o cache das malhas tesseladas
 import gpu          # Simula os recursos de uma GPU
 import math         # Funções matemáticas
 import numpy as np  # Biblioteca do Numpy
@@ -37,19 +38,36 @@ class GL:
     width = 800   # largura da tela
     height = 600  # altura da tela
     near = 0.01   # plano de corte próximo
+    aspect = 800/600  # razão de aspecto da imagem final
     far = 1000    # plano de corte distante
+    scissor = (0, 0, 800, 600)  # região (x0, y0, x1, y1) da tela em que se pode desenhar
+    frame_time = None  # instante do quadro atual, se None usa o relógio do sistema
+    triangles = 0  # contador de triângulos enviados para a rasterização (estatísticas)
+    culled = 0  # contador de formas descartadas por estarem fora do campo de visão
+    commands = None  # desenhos gravados do quadro atual (None desenha imediatamente)
+    lights = []   # luzes do quadro atual, em coordenadas do mundo
+    camera = np.zeros(3)  # posição da câmera no mundo
+    camera_rotation = np.identity(4)  # orientação da câmera no mundo
     
     @staticmethod
-    def setup(DEPTH, DRAW, width, height, near=0.01, far=1000):
+    def setup(DEPTH, DRAW, width, height, near=0.01, far=1000, aspect=None):
         """Definr parametros para câmera de razão de aspecto, plano próximo e distante."""
+        # aspect é a razão de aspecto da imagem final, que difere de width/height quando o
+        # super sampling usa fatores diferentes na horizontal e na vertical
         GL.DEPTH = DEPTH
         GL.DRAW = DRAW
         GL.width = width
         GL.height = height
+        GL.aspect = aspect if aspect else width/height
         GL.near = near
         GL.far = far
         GL.transformed = Stack()
         GL.transformed.push(GL.identityMatrix())
+        GL.scissor = (0, 0, width, height)
+        GL.frame_time = None
+        GL.lights = []
+        GL.materials = []
+        GL.material_ids = {}
         
 
     @staticmethod
@@ -67,17 +85,30 @@ class GL:
         # print("Polypoint2D : pontos = {0}".format(point)) # imprime no terminal pontos
         # print("Polypoint2D : colors = {0}".format(colors)) # imprime no terminal as cores
 
+        if GL.commands is not None:  # quadro sendo gravado para redesenho parcial (ver record)
+            GL.record(GL.polypoint2D, point, colors)
+            return
+
         R = colors['emissiveColor'][0]*255
         G = colors['emissiveColor'][1]*255
         B = colors['emissiveColor'][2]*255
 
+        # Assim como no draw_pixel, cores totalmente nulas não são escritas
+        if not any((R, G, B)):
+            return
+
         # Exemplo:
         # pos_x = GL.width//2
         # pos_y = GL.height//2
-        for i in range(0,len(point),2):
-            if (point[i] > 0 and point[i] < GL.width) and (point[i+1] > 0 and point[i+1] < GL.height):
-                gpu.GPU.draw_pixel([int(point[i]), int(point[i+1])], gpu.GPU.RGB8, [R, G, B])  # altera pixel (u, v, tipo, r, g, b)
-            #gpu.GPU.draw_pixel([GL.height//2, GL.width//2], gpu.GPU.RGB8, [R, G, B])
+        # Todos os pontos são testados e escritos de uma só vez no Framebuffer
+        points = np.asarray(point, dtype=float).reshape(-1, 2)
+        pixels = points.astype(int)
+        x0, y0, x1, y1 = GL.scissor
+        inside = (points[:, 0] > 0) & (points[:, 0] < GL.width) & \
+                 (points[:, 1] > 0) & (points[:, 1] < GL.height) & \
+                 (pixels[:, 0] >= x0) & (pixels[:, 0] < x1) & (pixels[:, 1] >= y0) & (pixels[:, 1] < y1)
+        gpu.GPU.draw_pixels(pixels, gpu.GPU.RGB8, [R, G, B], mask=inside)  # altera pixels (u, v, tipo, r, g, b)
+        #gpu.GPU.draw_pixel([GL.height//2, GL.width//2], gpu.GPU.RGB8, [R, G, B])
         # cuidado com as cores, o X3D especifica de (0,1) e o Framebuffer de (0,255)
         
     @staticmethod
@@ -96,43 +127,64 @@ class GL:
         # print("Polyline2D : lineSegments = {0}".format(lineSegments)) # imprime no terminal
         # print("Polyline2D : colors = {0}".format(colors)) # imprime no terminal as cores
 
+        if GL.commands is not None:  # quadro sendo gravado para redesenho parcial (ver record)
+            GL.record(GL.polyline2D, lineSegments, colors)
+            return
+
+        # Todos os segmentos são recortados e seus pixels gerados e escritos de uma só vez
+        points = np.trunc(np.asarray(lineSegments, dtype=float).reshape(-1, 2)).astype(int)
+        if len(points) < 2:
+            return
+        GL.polypoint2D(GL.linePixels(points[:-1], points[1:]).ravel(), colors)
 
-        for i in range(0,len(lineSegments)-2,2):
-            x0 = (int(lineSegments[i]))
-            y0 = (int(lineSegments[i+1]))
-            x1 = (int(lineSegments[i+2]))
-            y1 = (int(lineSegments[i+3]))
-
-            dx = (abs(x1-x0))
-            dy = (-abs(y1-y0))
-            error = (dx+dy)
-            sx = (1 if x0 < x1 else -1)
-            sy = (1 if y0 < y1 else -1)
-            
-
-            # Algoritmo de Bresenham
-            while True:
-                #print("x0,y0 = ",x0,y0)
-                GL.polypoint2D([x0, y0], colors) 
-                if 2*error >= dy:
-                    if x0 == x1:
-                        break
-                    x0  += sx
-                    error += dy
-                    
-                if 2*error <= dx:
-                    if y0 == y1:
-                        break
-                    y0  += sy
-                    error += dx
-                     
-        
         # Exemplo:
         # pos_x = GL.width//2
         # pos_y = GL.height//2
         #gpu.GPU.draw_pixel([pos_x, pos_y], gpu.GPU.RGB8, [R, G, B])  # altera pixel (u, v, tipo, r, g, b)
         # cuidado com as cores, o X3D especifica de (0,1) e o Framebuffer de (0,255)
 
+    @staticmethod
+    def linePixels(start, end):
+        """Retorna os pixels (x, y) dos segmentos de start a end visíveis na tela."""
+        # Os pixels são os do algoritmo de Bresenham: em cada passo no eixo de maior variação
+        # (major) a coordenada do outro eixo (minor) é arredondada com aritmética inteira.
+        # Antes, cada segmento é recortado (Liang-Barsky) na região de desenho com um pixel
+        # de folga, assim só os passos visíveis são gerados; os pixels gerados ainda são
+        # testados um a um por polypoint2D.
+        delta = end - start
+        size = np.abs(delta)
+        sign = np.where(delta < 0, -1, 1)
+        steps = size.max(axis=1)
+        x_major = size[:, 0] >= size[:, 1]
+
+        # Recorte paramétrico p(t) = start + t*delta, t em [0, 1]
+        x0, y0, x1, y1 = GL.scissor
+        lower = np.array([max(x0, 1), max(y0, 1)]) - 1
+        upper = np.array([min(x1, GL.width), min(y1, GL.height)])
+        t0, t1 = np.zeros(len(start)), np.ones(len(start))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for p, q in ((-delta, start - lower), (delta, upper - start)):
+                t = q / p
+                t0 = np.maximum(t0, np.where(p < 0, t, -np.inf).max(axis=1))
+                t1 = np.minimum(t1, np.where(p > 0, t, np.inf).min(axis=1))
+                t0[np.any((p == 0) & (q < 0), axis=1)] = np.inf  # paralelo e fora da região
+        visible = t0 <= t1
+        t0, t1 = np.where(visible, t0, 0), np.where(visible, t1, 0)
+        first = np.maximum(np.floor(t0 * steps) - 1, 0).astype(int)
+        last = np.minimum(np.ceil(t1 * steps) + 1, steps).astype(int)
+        counts = np.where(visible, last - first + 1, 0)
+
+        # Passos visíveis de todos os segmentos de uma só vez
+        owner = np.repeat(np.arange(len(start)), counts)
+        n = first[owner] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        major = np.where(x_major, size[:, 0], size[:, 1])[owner]
+        minor = np.where(x_major, size[:, 1], size[:, 0])[owner]
+        rounded = (2 * n * minor + major) // np.maximum(2 * major, 1)
+        step_x = np.where(x_major[owner], n, rounded)
+        step_y = np.where(x_major[owner], rounded, n)
+        return np.column_stack((start[owner, 0] + sign[owner, 0] * step_x,
+                                start[owner, 1] + sign[owner, 1] * step_y))
+
     @staticmethod
     def L(x, y, x0, y0, x1, y1):
         return (y1-y0)*x - (x1-x0)*y + y0*(x1-x0) - x0*(y1-y0)
@@ -150,25 +202,95 @@ class GL:
         # print("TriangleSet2D : vertices = {0}".format(vertices)) # imprime no terminal
         # print("TriangleSet2D : colors = {0}".format(colors)) # imprime no terminal as cores
 
-        for i in range(0,len(vertices),6):
-            
-            # Otimização: Definindo limites do bounding box dos triângulos
-
-            x_max = int(max([vertices[i+0], vertices[i+2], vertices[i+4]]))
-            x_min = int(min([vertices[i+0], vertices[i+2], vertices[i+4]]))
-            y_max = int(max([vertices[i+1], vertices[i+3], vertices[i+5]]))
-            y_min = int(min([vertices[i+1], vertices[i+3], vertices[i+5]]))
-            
-            for x in range(x_min, x_max + 1):
-                for y in range(y_min, y_max + 1):
-                    L1 = GL.L(vertices[i+0], vertices[i+1], vertices[i+2], vertices[i+3], x, y)
-                    L2 = GL.L(vertices[i+2], vertices[i+3], vertices[i+4], vertices[i+5], x, y)
-                    L3 = GL.L(vertices[i+4], vertices[i+5], vertices[i+0], vertices[i+1], x, y)
-                    if L1 >= 0 and L2 >= 0 and L3 >= 0:
-                        GL.polypoint2D([x, y], colors)
-
-    @staticmethod
-    def triangleSet(point, colors):
+        if GL.commands is not None:  # quadro sendo gravado para redesenho parcial (ver record)
+            GL.record(GL.triangleSet2D, vertices, colors)
+            return
+
+        triangles = np.asarray(vertices, dtype=float)
+        triangles = triangles[:len(triangles) - len(triangles) % 6].reshape(-1, 3, 2)
+        GL.triangles += len(triangles)
+        if len(triangles) == 0:
+            return
+
+        # Otimização: Definindo limites do bounding box dos triângulos
+        # (pixels fora da região de desenho seriam descartados no polypoint2D)
+        x_min = np.maximum(np.trunc(triangles[:, :, 0].min(axis=1)), GL.scissor[0]).astype(int)
+        x_max = np.minimum(np.trunc(triangles[:, :, 0].max(axis=1)), GL.scissor[2] - 1).astype(int)
+        y_min = np.maximum(np.trunc(triangles[:, :, 1].min(axis=1)), GL.scissor[1]).astype(int)
+        y_max = np.minimum(np.trunc(triangles[:, :, 1].max(axis=1)), GL.scissor[3] - 1).astype(int)
+        x, y, _ = GL.coverage(triangles, x_min, x_max, y_min, y_max)
+
+        # Todos os triângulos têm a mesma cor, então os pixels são escritos em um único lote
+        GL.polypoint2D(np.column_stack((x, y)), colors)
+
+    # Motor de rasterização que escolhe os pixels testados em cada triângulo:
+    # "bbox" testa todos os pixels do bounding box e "scanline" só os dos trechos de cada
+    # linha entre as arestas. O resultado é o mesmo, o mais rápido depende da cena.
+    ENGINES = ("bbox", "scanline")
+    ENGINE = "bbox"
+    SPAN_EPSILON = 1e-6  # inclinação mínima de uma aresta para limitar os trechos
+    EDGE_EPSILON = 1e-7  # distância (em pixels) por fora das arestas ainda aceita como dentro
+
+    @staticmethod
+    def coverage(triangles, x_min, x_max, y_min, y_max):
+        """Retorna os pixels (x, y) cobertos pelos triângulos e o índice do triângulo de cada um."""
+        # triangles tem as coordenadas (x, y, ...) de tela dos vértices e x_min, x_max, y_min e
+        # y_max os limites (inclusive) dos pixels a considerar em cada triângulo.
+        if GL.ENGINE == "scanline":
+            x, y, owner = GL.spanPixels(triangles, x_min, x_max, y_min, y_max)
+        else:
+            x, y, owner = GL.boxPixels(x_min, x_max, y_min, y_max)
+
+        # Teste das funções de aresta nos pixels candidatos. Um pixel exatamente sobre a aresta
+        # comum a dois triângulos pode, por arredondamento, ficar fora dos dois; a pequena
+        # tolerância (proporcional ao comprimento da aresta) evita esses buracos.
+        inside = np.ones(len(x), dtype=bool)
+        for i in range(3):
+            xP, yP = triangles[owner, i, 0], triangles[owner, i, 1]
+            xQ, yQ = triangles[owner, (i+1) % 3, 0], triangles[owner, (i+1) % 3, 1]
+            tolerance = GL.EDGE_EPSILON * (np.abs(xQ - xP) + np.abs(yQ - yP))
+            inside &= GL.L(xP, yP, xQ, yQ, x, y) >= -tolerance
+        return x[inside], y[inside], owner[inside]
+
+    @staticmethod
+    def boxPixels(x_min, x_max, y_min, y_max):
+        """Gera todos os pixels dos bounding boxes dos triângulos."""
+        widths = np.maximum(x_max - x_min + 1, 0)
+        sizes = widths * np.maximum(y_max - y_min + 1, 0)
+        owner = np.repeat(np.arange(len(sizes)), sizes)
+        offset = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        return x_min[owner] + offset % widths[owner], y_min[owner] + offset // widths[owner], owner
+
+    @staticmethod
+    def spanPixels(triangles, x_min, x_max, y_min, y_max):
+        """Gera os pixels dos trechos de cada linha entre as arestas dos triângulos."""
+        # Em cada linha as funções de aresta variam linearmente com x (a*x + b), então o
+        # trecho interno é limitado pelas raízes de cada uma. Todas as linhas de todos os
+        # triângulos são tratadas de uma só vez; os trechos têm um pixel de folga em cada
+        # ponta para os arredondamentos, que o teste das arestas descarta. Arestas quase
+        # horizontais não limitam o trecho (a raiz seria imprecisa).
+        rows = np.maximum(y_max - y_min + 1, 0)
+        owner = np.repeat(np.arange(len(rows)), rows)
+        y = y_min[owner] + np.arange(rows.sum()) - np.repeat(np.cumsum(rows) - rows, rows)
+
+        start = x_min[owner].astype(float)
+        end = x_max[owner].astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in range(3):
+                xP, yP = triangles[owner, i, 0], triangles[owner, i, 1]
+                xQ, yQ = triangles[owner, (i+1) % 3, 0], triangles[owner, (i+1) % 3, 1]
+                a = yQ - yP
+                root = -GL.L(xP, yP, xQ, yQ, 0, y) / a
+                start = np.where(a > GL.SPAN_EPSILON, np.maximum(start, np.ceil(root) - 1), start)
+                end = np.where(a < -GL.SPAN_EPSILON, np.minimum(end, np.floor(root) + 1), end)
+        widths = np.maximum(end - start + 1, 0).astype(int)
+
+        pixels = np.repeat(np.arange(len(widths)), widths)
+        x = start.astype(int)[pixels] + np.arange(widths.sum()) - np.repeat(np.cumsum(widths) - widths, widths)
+        return x, y[pixels], owner[pixels]
+
+    @staticmethod
+    def triangleSet(point, colors, ccw=True, solid=True, texCoord=None, normal=None):
         """Função usada para renderizar TriangleSet."""
         # Nessa função você receberá pontos no parâmetro point, esses pontos são uma lista
         # de pontos x, y, e z sempre na ordem. Assim point[0] é o valor da coordenada x do
@@ -182,6 +304,13 @@ class GL:
         # inicialmente, para o TriangleSet, o desenho das linhas com a cor emissiva
         # (emissiveColor), conforme implementar novos materias você deverá suportar outros
         # tipos de cores.
+        # Os parâmetros ccw e solid são os campos de mesmo nome do X3D: ccw indica se as
+        # faces da frente têm os vértices em sentido anti-horário e com solid as faces de
+        # costas não são desenhadas (sem solid os dois lados são desenhados).
+        # Com texCoord, uma coordenada (u, v) por vértice, a textura de colors["texture"] é
+        # aplicada nos triângulos. Com colors["lighting"] (formas com Material) os triângulos
+        # são iluminados pelas luzes da cena, usando as normais por vértice de normal ou,
+        # sem elas, as normais das faces.
 
         # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
         #print("TriangleSet : pontos = {0}".format(point)) # imprime no terminal pontos
@@ -189,72 +318,350 @@ class GL:
 
         # Exemplo de desenho de um pixel branco na coordenada 10, 10
         #gpu.GPU.draw_pixel([10, 10], gpu.GPU.RGB8, [255, 255, 255])  # altera pixel
-        
-        triangle_vertices = []
 
-        for i in range(0, len(point), 3):
-            triangle_vertices.append([ point[i], point[i+1], point[i+2], 1 ])
-        
-        triangle_vertices = np.transpose(np.array(triangle_vertices))
+        if GL.commands is not None:  # quadro sendo gravado para redesenho parcial (ver record)
+            GL.record(GL.triangleSet, point, colors, ccw, solid, texCoord, normal)
+            return
+
+        vertices = np.asarray(point, dtype=float)
+        vertices = vertices[:len(vertices) - len(vertices) % 9].reshape(-1, 3)
+        if len(vertices) == 0:
+            return
+        GL.triangles += len(vertices) // 3
+
+        # Coordenadas homogêneas de todos os vértices de uma só vez
+        triangle_vertices = np.transpose(np.column_stack((vertices, np.ones(len(vertices)))))
 
         transformed_matrix = np.matmul(GL.transformed.peek(), triangle_vertices)
 
         viewpoint_matrix = np.transpose(np.matmul(GL.projected, transformed_matrix)) 
-        
-        points_matrix = np.copy(viewpoint_matrix)
+
+        if texCoord is not None:
+            texCoord = np.asarray(texCoord, dtype=float).reshape(-1, 2)[:len(vertices)]
+
+        # Iluminação (a textura, quando houver, substitui as cores do material). Sem luzes
+        # resta só a cor emissiva, desenhada diretamente.
+        surface = material = None
+        lit = isinstance(colors, dict) and colors.get("lighting") and GL.lights
+        if lit and not (texCoord is not None and colors.get("texture")):
+            if normal is None:
+                normal = GL.vertexNormals(vertices, ccw=ccw)
+            normal = GL.worldNormals(np.asarray(normal, dtype=float).reshape(-1, 3)[:len(vertices)])
+            diffuse = np.broadcast_to(np.asarray(colors["diffuseColor"], dtype=float), vertices.shape)
+            material = dict(colors, solid=solid)
+            if GL.SHADING in ("phong", "deferred"):
+                # Posição, normal e cor difusa são interpoladas e a iluminação é feita nos pixels
+                # (no deferred só depois de todas as formas, ver deferredLighting)
+                surface = np.column_stack((transformed_matrix[:3].T, normal, diffuse))
+            else:
+                # Iluminação nos vértices, cujas cores são interpoladas nos pixels
+                colors = GL.light(transformed_matrix[:3].T, normal, diffuse, material)
+
+        # Recorte no plano próximo antes da divisão (vértices atrás da câmera têm w negativo)
+        viewpoint_matrix, colors, texCoord, surface = GL.clipNear(viewpoint_matrix, colors, texCoord, surface)
+        if len(viewpoint_matrix) == 0:
+            return
 
         # Divisão Homogênea (Homogeneous Divide) 
-        for i in range(len(points_matrix)):
-            points_matrix[i] /= points_matrix[i][-1]
-
-        for i in range(0,len(points_matrix),3):
-            #GL.triangleSet2D(np.concatenate((points_matrix[i+0][:2], points_matrix[i+1][:2],points_matrix[i+2][:2])), colors)
-            Zs = [points_matrix[i][2],points_matrix[i+1][2],points_matrix[i+2][2]]
-            point1,point2,point3 = points_matrix[i+0][:2], points_matrix[i+1][:2],points_matrix[i+2][:2]
-                # Otimização: Definindo limites do bounding box dos triângulos
-            x_max = int(max([point1[0], point2[0], point3[0]]))
-            x_min = int(min([point1[0], point2[0], point3[0]]))
-            y_max = int(max([point1[1], point2[1], point3[1]]))
-            y_min = int(min([point1[1], point2[1], point3[1]]))
-            if type(colors) is list:
-                C1,C2,C3 = colors[:3],colors[3:6],colors[6:]
-            for x in range(x_min, x_max + 1):
-                for y in range(y_min, y_max + 1):
-                    L1 = GL.L(point1[0], point1[1], point2[0], point2[1], x, y)
-                    L2 = GL.L(point2[0], point2[1], point3[0], point3[1], x, y)
-                    L3 = GL.L(point3[0], point3[1], point1[0], point1[1], x, y)
-                    if L1 >= 0 and L2 >= 0 and L3 >= 0:
-                        #GL.polypoint2D([x, y], colors)
-                        
-                        # Interpolação
-                        xA,yA = point1
-                        xB,yB = point2
-                        xC,yC = point3
-                        # Definindo as coordenadas baricêntricas alpha, beta e gama
-                        alpha = (-(x-xB) * (yC-yB) + (y-yB) * (xC-xB)) / (-(xA-xB) * (yC-yB) + (yA-yB) * (xC-xB))
-                        beta = (-(x-xC) * (yA-yC) + (y-yC) * (xA-xC)) / (-(xB-xC) * (yA-yC) + (yB-yC) * (xA-xC))
-                        gama = 1 - alpha - beta
-                        Z1, Z2, Z3 = Zs
-                        # Retorna a Média harmônica ponderada
-                        Z = 1 / (alpha / Z1 + beta / Z2 + gama / Z3)
-
-                        gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DEPTH) 
-                        if (x > 0 and x < GL.width) and (y > 0 and y < GL.height):
-                            if (Z < gpu.GPU.read_pixel([x,y], gpu.GPU.DEPTH_COMPONENT32F)):
-                                if type(colors) is list:
-                                    Cs = [[alpha*color for color in C1], [beta *color for color in C2], [gama *color for color in C3]]
-                                    _color = [sum(c * 255) for c in zip(*Cs)]
-                                gpu.GPU.draw_pixel([x,y], gpu.GPU.DEPTH_COMPONENT32F, [Z])
-                                gpu.GPU.draw_pixel([x,y], gpu.GPU.RGB8, 3*[Z*255])
-                                gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DRAW)
-                                if type(colors) is list:
-                                    gpu.GPU.draw_pixel([x,y], gpu.GPU.RGB8, _color)
-                                else:
-                                    pixel_color = gpu.GPU.read_pixel([x,y], gpu.GPU.RGB8)
-                                    pixel_color = [c * colors["transparency"] for c in pixel_color]
-                                    emissive_color = [c * (1-colors["transparency"]) for c in colors["emissiveColor"]]
-                                    gpu.GPU.draw_pixel([x,y], gpu.GPU.RGB8, np.clip([int(sum(c * 255)) for c in zip(emissive_color, pixel_color)], 0, 255))
-                            gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DRAW)
+        w = viewpoint_matrix[:, 3]
+        points_matrix = viewpoint_matrix / w[:, np.newaxis]
+
+        points, w, colors, texCoord, surface = GL.cullFaces(points_matrix[:, :3], w, colors, ccw, solid,
+                                                             texCoord, surface)
+        GL.rasterizeTriangles(points, w, colors, texCoord, surface, material)
+
+    @staticmethod
+    def clipNear(vertices, colors, *attributes):
+        """Recorta os triângulos no plano próximo, em coordenadas homogêneas."""
+        # vertices são as coordenadas (x, y, z, w) após a projeção, de 3 em 3 formando os
+        # triângulos. Como w é a distância até a câmera, a parte visível é a com w >= near.
+        # Os demais planos do campo de visão não precisam de recorte: o rasterizador limita
+        # os bounding boxes à tela (guard band). Cores por vértice e os demais atributos
+        # (uma linha por vértice, ou None) são interpolados junto.
+        triangles = vertices.reshape(-1, 3, 4)
+        distance = triangles[:, :, 3] - GL.near
+        inside = distance >= 0
+        count = inside.sum(axis=1)
+        if np.all(count == 3):
+            return (vertices, colors, *attributes)
+
+        per_vertex = not isinstance(colors, dict)
+        arrays = [np.asarray(colors, dtype=float) if per_vertex else None] + list(attributes)
+        arrays = [None if array is None else array.reshape(len(triangles), 3, -1) for array in arrays]
+        triangles = np.concatenate([triangles] + [array for array in arrays if array is not None], axis=2)
+
+        def rotate(selected, first):
+            """Gira os vértices (mantendo a orientação) para first ser o primeiro."""
+            order = (first[:, np.newaxis] + np.arange(3)) % 3
+            rows = np.arange(len(order))[:, np.newaxis]
+            return triangles[selected][rows, order], distance[selected][rows, order]
+
+        def intersect(P, Q, dP, dQ):
+            """Ponto onde a aresta PQ cruza o plano próximo."""
+            return P + (dP / (dP - dQ))[:, np.newaxis] * (Q - P)
+
+        # Um vértice dentro: resta um triângulo menor
+        one, d = rotate(count == 1, np.argmax(inside[count == 1], axis=1))
+        A, B, C = one[:, 0], one[:, 1], one[:, 2]
+        AB = intersect(A, B, d[:, 0], d[:, 1])
+        AC = intersect(A, C, d[:, 0], d[:, 2])
+        one = np.stack((A, AB, AC), axis=1)
+
+        # Dois vértices dentro: resta um quadrilátero, dividido em dois triângulos
+        two, d = rotate(count == 2, np.argmin(inside[count == 2], axis=1))
+        A, B, C = two[:, 0], two[:, 1], two[:, 2]
+        AB = intersect(A, B, d[:, 0], d[:, 1])
+        CA = intersect(C, A, d[:, 2], d[:, 0])
+        two = np.concatenate((np.stack((B, C, CA), axis=1), np.stack((B, CA, AB), axis=1)))
+
+        # Os triângulos recortados voltam à ordem original (importa com transparência)
+        source = np.concatenate((np.flatnonzero(count == 3), np.flatnonzero(count == 1),
+                                 np.tile(np.flatnonzero(count == 2), 2)))
+        triangles = np.concatenate((triangles[count == 3], one, two))[np.argsort(source, kind="stable")]
+        # Os atributos são separados de volta, cada um com suas colunas
+        start = 4
+        for i, array in enumerate(arrays):
+            if array is not None:
+                arrays[i] = triangles[:, :, start:start + array.shape[2]].reshape(-1, array.shape[2])
+                start += array.shape[2]
+        if per_vertex:
+            colors = arrays[0]
+        return (triangles[:, :, :4].reshape(-1, 4), colors, *arrays[1:])
+
+    @staticmethod
+    def cullFaces(points, w, colors, ccw=True, solid=True, *attributes):
+        """Descarta os triângulos de costas e deixa os demais na orientação do rasterizador."""
+        # A orientação é dada pelo sinal da área dos triângulos já projetados na tela. Como o
+        # eixo y da tela é espelhado, um triângulo anti-horário visto pela câmera tem área
+        # negativa, que é a única orientação aceita por rasterizeTriangles.
+        triangles = points.reshape(-1, 3, 3)
+        w = np.asarray(w, dtype=float).reshape(-1, 3)
+        xA, yA, xB, yB, xC, yC = (triangles[:, i, j] for i in range(3) for j in range(2))
+        with np.errstate(invalid='ignore'):
+            area = (xB - xA) * (yC - yA) - (xC - xA) * (yB - yA)
+            front = area < 0 if ccw else area > 0
+            keep = front if solid else area != 0
+            flip = area[keep] > 0  # faces de costas desenhadas (sem solid) ou ccw falso
+
+        # Trocar dois vértices inverte a orientação do triângulo
+        order = np.where(flip[:, np.newaxis], [0, 2, 1], [0, 1, 2])
+        rows = np.arange(len(order))[:, np.newaxis]
+        triangles = triangles[keep][rows, order]
+        w = w[keep][rows, order]
+        if not isinstance(colors, dict):
+            colors = np.asarray(colors, dtype=float).reshape(-1, 3, 3)[keep][rows, order]
+        attributes = [None if array is None else
+                      array.reshape(len(keep), 3, -1)[keep][rows, order].reshape(-1, array.shape[-1])
+                      for array in attributes]
+        return (triangles.reshape(-1, 3), w.ravel(), colors, *attributes)
+
+    # Quantidade máxima de pixels avaliados de uma só vez pelo rasterizador vetorizado
+    TILE_PIXELS = 1 << 18
+
+    @staticmethod
+    def rasterizeTriangles(points, w, colors, texCoord=None, surface=None, material=None):
+        """Rasteriza de uma só vez todos os triângulos já projetados na tela."""
+        # points possui as coordenadas (x, y, z) de tela de cada vértice, de 3 em 3 formando
+        # os triângulos, e w o valor da coordenada homogênea antes da divisão, usado para as
+        # coordenadas baricêntricas com correção de perspectiva. colors pode ser o dicionário
+        # de cores do material ou uma lista com uma cor (r, g, b) por vértice. texCoord, se
+        # houver textura em colors, tem as coordenadas (u, v) de cada vértice. Nas formas
+        # iluminadas material é o dicionário do material e surface, na iluminação por pixel,
+        # tem a posição no mundo, a normal e a cor difusa de cada vértice. No shading deferred
+        # os pixels dessas formas (se opacas) só gravam o G-buffer, iluminado no final.
+        triangles = np.asarray(points, dtype=float).reshape(-1, 3, 3)
+        with np.errstate(divide='ignore'):
+            inv_w = 1 / np.asarray(w, dtype=float).reshape(-1, 3)
+
+        vertex_colors = vertex_uv = vertex_surface = None
+        if isinstance(colors, dict):
+            transparency = colors["transparency"]
+            emissive = np.asarray(colors["emissiveColor"], dtype=float) * 255
+            if texCoord is not None and colors.get("texture"):
+                vertex_uv = np.asarray(texCoord, dtype=float).reshape(-1, 3, 2)
+                mipmaps = GL.texture(colors["texture"])
+                repeat = (colors.get("repeatS", True), colors.get("repeatT", True))
+            elif surface is not None:
+                vertex_surface = np.asarray(surface, dtype=float).reshape(-1, 3, 9)
+        else:
+            vertex_colors = np.asarray(colors, dtype=float).reshape(-1, 3, 3) * 255
+            transparency = material["transparency"] if material else 0
+
+        # Identificador do material gravado no G-buffer (0 para os pixels já com a cor final)
+        deferred = GL.SHADING == "deferred"
+        material_id = GL.materialId(material) if deferred and vertex_surface is not None and \
+            not transparency else 0
+
+        # Otimização: Definindo limites do bounding box dos triângulos (já dentro da tela)
+        valid = np.all(np.isfinite(triangles[:, :, :2]), axis=(1, 2))
+        triangles = triangles[valid]
+        inv_w = inv_w[valid]
+        if vertex_colors is not None:
+            vertex_colors = vertex_colors[valid]
+        if vertex_uv is not None:
+            vertex_uv = vertex_uv[valid]
+        if vertex_surface is not None:
+            vertex_surface = vertex_surface[valid]
+        x0, y0, x1, y1 = GL.scissor
+        x_min = np.maximum(np.trunc(triangles[:, :, 0].min(axis=1)), max(1, x0)).astype(int)
+        x_max = np.minimum(np.trunc(triangles[:, :, 0].max(axis=1)), min(GL.width, x1) - 1).astype(int)
+        y_min = np.maximum(np.trunc(triangles[:, :, 1].min(axis=1)), max(1, y0)).astype(int)
+        y_max = np.minimum(np.trunc(triangles[:, :, 1].max(axis=1)), min(GL.height, y1) - 1).astype(int)
+        area = np.maximum(x_max - x_min + 1, 0) * np.maximum(y_max - y_min + 1, 0)
+
+        # Agrupa os triângulos em blocos de até TILE_PIXELS pixels. Com transparência a ordem
+        # de escrita importa, então nesse caso cada triângulo é tratado individualmente.
+        ids = np.flatnonzero(area > 0)
+        cumulative = np.cumsum(area[ids])
+        start = 0
+        while start < len(ids):
+            if transparency:
+                end = start + 1
+            else:
+                limit = (cumulative[start-1] if start else 0) + GL.TILE_PIXELS
+                end = max(start + 1, int(np.searchsorted(cumulative, limit, side='right')))
+            tile = ids[start:end]
+            start = end
+
+            # Pixels cobertos pelos triângulos do bloco (conforme o motor de rasterização)
+            x, y, owner = GL.coverage(triangles[tile], x_min[tile], x_max[tile], y_min[tile], y_max[tile])
+            if len(x) == 0:
+                continue
+            owner = tile[owner]
+
+            vertices = triangles[owner]
+            ZA, ZB, ZC = vertices[:, :, 2].T
+
+            # Definindo as coordenadas baricêntricas alpha, beta e gama
+            # (triângulos degenerados geram NaN e são descartados no teste de profundidade)
+            alpha, beta, gama = GL.barycentric(vertices, x, y)
+
+            # A profundidade normalizada é linear no espaço da tela
+            with np.errstate(invalid='ignore'):
+                Z = alpha * ZA + beta * ZB + gama * ZC
+
+            # Teste de profundidade (Z-buffer)
+            coords = np.column_stack((x, y))
+            gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DEPTH)
+            with np.errstate(invalid='ignore'):
+                visible = Z < gpu.GPU.read_pixels(coords, gpu.GPU.DEPTH_COMPONENT32F)[:, 0]
+
+            # Entre fragmentos do bloco no mesmo pixel fica o mais próximo (ou o primeiro)
+            linear = (y * GL.width + x)[visible]
+            fragments = np.flatnonzero(visible)
+            order = np.lexsort((fragments, Z[fragments], linear))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = linear[order][1:] != linear[order][:-1]
+            fragments = fragments[order[first]]
+            if len(fragments) == 0:
+                continue
+
+            coords = coords[fragments]
+            Z = Z[fragments]
+            if deferred:
+                if transparency:
+                    # A mistura precisa da cor final dos pixels que ainda estão no G-buffer
+                    GL.deferredLighting(coords)
+                    gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DEPTH)
+                gpu.GPU.draw_pixels(coords, gpu.GPU.MATERIAL32I, material_id)
+            gpu.GPU.draw_pixels(coords, gpu.GPU.DEPTH_COMPONENT32F, Z)
+            gpu.GPU.draw_pixels(coords, gpu.GPU.RGB8, np.repeat(np.clip(Z * 255, 0, 255)[:, np.newaxis], 3, axis=1))
+            gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DRAW)
+
+            if vertex_uv is not None:
+                # Coordenadas de textura com correção de perspectiva no pixel e nos vizinhos à
+                # direita e abaixo, cujas diferenças escolhem o nível do mipmap
+                vertices, owner = vertices[fragments], owner[fragments]
+                x, y = x[fragments], y[fragments]
+                uv = GL.perspective(vertices, inv_w[owner], vertex_uv[owner], x, y)
+                du = GL.perspective(vertices, inv_w[owner], vertex_uv[owner], x + 1, y) - uv
+                dv = GL.perspective(vertices, inv_w[owner], vertex_uv[owner], x, y + 1) - uv
+                color = GL.sampleTexture(mipmaps, uv, du, dv, repeat)
+            elif vertex_surface is not None:
+                # Iluminação em cada pixel com os atributos interpolados com correção de perspectiva
+                owner = owner[fragments]
+                values = GL.perspective(vertices[fragments], inv_w[owner], vertex_surface[owner],
+                                        x[fragments], y[fragments])
+                if material_id:
+                    # Geometria do shading deferred: normal e cor difusa vão para o G-buffer
+                    gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DEPTH)
+                    gpu.GPU.draw_pixels(coords, gpu.GPU.NORMAL32F, values[:, 3:6])
+                    gpu.GPU.draw_pixels(coords, gpu.GPU.ALBEDO32F, values[:, 6:])
+                    gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DRAW)
+                    continue
+                color = GL.light(values[:, :3], values[:, 3:6], values[:, 6:], material) * 255
+            elif vertex_colors is not None:
+                # Interpolação das cores com correção de perspectiva
+                owner = owner[fragments]
+                weights = np.column_stack((alpha[fragments], beta[fragments], gama[fragments])) * inv_w[owner]
+                weights /= weights.sum(axis=1, keepdims=True)
+                color = np.einsum('ij,ijk->ik', weights, vertex_colors[owner])
+            else:
+                color = np.broadcast_to(emissive, (len(fragments), 3))
+            if transparency:
+                pixel_color = gpu.GPU.read_pixels(coords, gpu.GPU.RGB8)
+                color = color * (1 - transparency) + pixel_color * transparency
+            gpu.GPU.draw_pixels(coords, gpu.GPU.RGB8, np.clip(color, 0, 255))
+
+        gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DRAW)
+
+    @staticmethod
+    def barycentric(vertices, x, y):
+        """Coordenadas baricêntricas (alpha, beta, gama) dos pontos (x, y) nos triângulos."""
+        xA, yA, xB, yB, xC, yC = (vertices[:, i, j] for i in range(3) for j in range(2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = (-(x-xB) * (yC-yB) + (y-yB) * (xC-xB)) / (-(xA-xB) * (yC-yB) + (yA-yB) * (xC-xB))
+            beta = (-(x-xC) * (yA-yC) + (y-yC) * (xA-xC)) / (-(xB-xC) * (yA-yC) + (yB-yC) * (xA-xC))
+        return alpha, beta, 1 - alpha - beta
+
+    @staticmethod
+    def perspective(vertices, inv_w, attributes, x, y):
+        """Interpola com correção de perspectiva os atributos dos vértices nos pontos (x, y)."""
+        # Os pesos baricêntricos são divididos pelo w de cada vértice e normalizados
+        with np.errstate(invalid='ignore'):
+            weights = np.column_stack(GL.barycentric(vertices, x, y)) * inv_w
+            weights /= weights.sum(axis=1, keepdims=True)
+        return np.einsum('ij,ijk->ik', weights, attributes)
+
+    @staticmethod
+    def texture(url):
+        """Retorna os níveis do mipmap da textura (8bits por canal), do cache da GPU."""
+        # Os níveis são gerados pela GPU na primeira vez em que a textura é usada e ficam no
+        # mesmo cache limitado em bytes (e compartilhado em disco) das imagens decodificadas
+        return gpu.GPU.load_mipmaps(url)
+
+    @staticmethod
+    def sampleTexture(mipmaps, uv, du, dv, repeat):
+        """Amostra a textura nas coordenadas uv com o nível do mipmap escolhido por fragmento."""
+        # du e dv são as variações de uv de um pixel para o vizinho em x e em y; o nível é o
+        # log2 de quantos texels do nível 0 um pixel cobre (nível mais próximo, filtro bilinear)
+        size = np.array(mipmaps[0].shape[1::-1], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            footprint = np.maximum(np.hypot(*(du * size).T), np.hypot(*(dv * size).T))
+            lod = np.nan_to_num(np.round(np.log2(footprint)), nan=0, posinf=len(mipmaps) - 1)
+        lod = np.clip(lod, 0, len(mipmaps) - 1).astype(int)
+
+        color = np.empty((len(uv), 3))
+        for level in np.unique(lod):
+            texels = mipmaps[level]
+            height, width = texels.shape[:2]
+            fragments = lod == level
+            # O v da textura cresce para cima e as linhas da imagem para baixo
+            s = np.nan_to_num(uv[fragments, 0]) * width - 0.5
+            t = (1 - np.nan_to_num(uv[fragments, 1])) * height - 0.5
+            s0, t0 = np.floor(s), np.floor(t)
+            fs, ft = (s - s0)[:, np.newaxis], (t - t0)[:, np.newaxis]
+
+            def wrap(index, count, repeated):
+                """Índices dos texels repetindo a textura (repeat) ou estendendo suas bordas."""
+                index = index.astype(int)
+                return index % count if repeated else np.clip(index, 0, count - 1)
+
+            i0, i1 = wrap(s0, width, repeat[0]), wrap(s0 + 1, width, repeat[0])
+            j0, j1 = wrap(t0, height, repeat[1]), wrap(t0 + 1, height, repeat[1])
+            color[fragments] = ((texels[j0, i0] * (1 - fs) + texels[j0, i1] * fs) * (1 - ft) +
+                                (texels[j1, i0] * (1 - fs) + texels[j1, i1] * fs) * ft)
+        return color
 
     @staticmethod
     def translateMatrix(ex,ey,ez):
@@ -336,9 +743,9 @@ class GL:
         rotation_matrix = GL.rotationMatrix(Qr,Qi,Qj,Qk)
         lookAt_matrix = np.matmul(np.transpose(rotation_matrix), lookAt_translation_matrix)
         
-        FOVy = GL.FOVy(fieldOfView,GL.height,GL.width)
+        FOVy = GL.FOVy(fieldOfView,GL.height,GL.height*GL.aspect)
         top = GL.near*np.tan(FOVy)
-        aspect = GL.width/GL.height
+        aspect = GL.aspect
         right = top*aspect
 
         perspective_matrix = GL.perspectiveMatrix(GL.near,right,top,GL.far)
@@ -348,9 +755,13 @@ class GL:
         GL.projected = np.matmul(display_matrix, perspective_matrix)
         GL.projected = np.matmul(GL.projected, lookAt_matrix)
 
+        # Posição e orientação da câmera no mundo, usadas na iluminação
+        GL.camera = np.array(position, dtype=float)
+        GL.camera_rotation = rotation_matrix
+
 
     @staticmethod
-    def transform_in(translation, scale, rotation):
+    def transform_in(translation, scale, rotation, cache=None):
         """Função usada para renderizar (na verdade coletar os dados) de Transform."""
         # A função transform_in será chamada quando se entrar em um nó X3D do tipo Transform
         # do grafo de cena. Os valores passados são a escala em um vetor [x, y, z]
@@ -369,8 +780,30 @@ class GL:
         # if rotation:
         #     print("rotation = {0} ".format(rotation), end='') # imprime no terminal
         # print("")
-        
-        
+
+        if cache is None:
+            transformation_matrix = GL.transformMatrix(translation, scale, rotation)
+            GL.transformed.push(np.matmul(GL.transformed.peek(),transformation_matrix))
+            return
+
+        # Com cache as matrizes local e de mundo do nó são guardadas entre os quadros. A local
+        # só é refeita quando o nó é marcado como alterado (cache["dirty"]) e a de mundo quando
+        # a local ou a matriz do pai mudam. Como pais sem alterações empilham sempre o mesmo
+        # objeto, basta comparar a identidade da matriz do pai para invalidar a sub-árvore.
+        parent = GL.transformed.peek()
+        if cache.get("dirty", True):
+            cache["local"] = GL.transformMatrix(translation, scale, rotation)
+            cache["dirty"] = False
+            cache["parent"] = None
+        if cache.get("parent") is not parent:
+            cache["parent"] = parent
+            cache["world"] = np.matmul(parent, cache["local"])
+        GL.transformed.push(cache["world"])
+        #print(GL.transformed.stack)
+
+    @staticmethod
+    def transformMatrix(translation, scale, rotation):
+        """Retorna a matriz de transformação local de um Transform."""
         axis = np.array([rotation[0], rotation[1], rotation[2]])
         axis = axis / np.linalg.norm(axis)
 
@@ -381,8 +814,7 @@ class GL:
         
         transformation_matrix = np.matmul(GL.translateMatrix(translation[0], translation[1], translation[2]), GL.rotationMatrix(Qr,Qi,Qj,Qk))
         transformation_matrix = np.matmul(transformation_matrix, GL.scaleMatrix(scale[0],scale[1],scale[2]))
-        GL.transformed.push(np.matmul(GL.transformed.peek(),transformation_matrix))
-        #print(GL.transformed.stack)
+        return transformation_matrix
 
     @staticmethod
     def transform_out():
@@ -398,7 +830,7 @@ class GL:
         GL.transformed.pop()
 
     @staticmethod
-    def triangleStripSet(point, stripCount, colors):
+    def triangleStripSet(point, stripCount, colors, ccw=True, solid=True):
         """Função usada para renderizar TriangleStripSet."""
         # A função triangleStripSet é usada para desenhar tiras de triângulos interconectados,
         # você receberá as coordenadas dos pontos no parâmetro point, esses pontos são uma
@@ -421,22 +853,13 @@ class GL:
         # Exemplo de desenho de um pixel branco na coordenada 10, 10
         # gpu.GPU.draw_pixel([10, 10], gpu.GPU.RGB8, [255, 255, 255])  # altera pixel
         
-        for i in range(stripCount[0]-2):
-            first = i*3
-            second = (i+1)*3
-            third = (i+2)*3
-            
-            if i % 2 == 0:
-                order = [*point[first:first+3], *point[second:second+3], *point[third:third+3]]
-                
-            else:
-                order = [*point[second:second+3], *point[first:first+3], *point[third:third+3]]
-
-            GL.triangleSet(order,colors)
+        # Todas as tiras são montadas e enviadas de uma só vez ao triangleSet
+        vertices = np.asarray(point, dtype=float).reshape(-1, 3)
+        GL.triangleSet(vertices[GL.stripSetIndexes(stripCount)].ravel(), colors, ccw, solid)
 
 
     @staticmethod
-    def indexedTriangleStripSet(point, index, colors):
+    def indexedTriangleStripSet(point, index, colors, ccw=True, solid=True):
         """Função usada para renderizar IndexedTriangleStripSet."""
         # A função indexedTriangleStripSet é usada para desenhar tiras de triângulos
         # interconectados, você receberá as coordenadas dos pontos no parâmetro point, esses
@@ -457,22 +880,52 @@ class GL:
         # Exemplo de desenho de um pixel branco na coordenada 10, 10
         # gpu.GPU.draw_pixel([10, 10], gpu.GPU.RGB8, [255, 255, 255])  # altera pixel
 
-        for i in range(len(index)-3):
-            first = i*3
-            second = (i+1)*3
-            third = (i+2)*3
+        # Todas as tiras (separadas por -1) são montadas e enviadas de uma só vez ao triangleSet
+        vertices = np.asarray(point, dtype=float).reshape(-1, 3)
+        GL.triangleSet(vertices[GL.indexedStripIndexes(index)].ravel(), colors, ccw, solid)
 
-            if i % 2 == 0:
-                order = [*point[first:first+3], *point[second:second+3], *point[third:third+3]]
-                
-            else:
-                order = [*point[second:second+3], *point[first:first+3], *point[third:third+3]]
+    @staticmethod
+    def splitIndexes(index):
+        """Separa uma lista de índices nos trechos delimitados por -1."""
+        index = np.asarray(index, dtype=int)
+        parts = np.split(index, np.flatnonzero(index == -1))
+        parts = [part[part != -1] for part in parts]
+        return [part for part in parts if len(part) > 0]
+
+    @staticmethod
+    def faceIndexes(index):
+        """Retorna os índices dos triângulos (em leque) das faces separadas por -1."""
+        faces = [face[np.column_stack((np.zeros(len(face)-2, dtype=int),
+                                       np.arange(1, len(face)-1),
+                                       np.arange(2, len(face))))]
+                 for face in GL.splitIndexes(index)]
+        return np.concatenate(faces) if faces else np.empty((0, 3), dtype=int)
+
+    @staticmethod
+    def stripIndexes(count):
+        """Retorna os índices dos vértices dos count primeiros triângulos de uma tira."""
+        # Os triângulos ímpares têm os dois primeiros vértices trocados para manter a orientação
+        i = np.arange(max(count, 0))
+        indexes = np.column_stack((i, i+1, i+2))
+        indexes[1::2, :2] = indexes[1::2, 1::-1]
+        return indexes
+
+    @staticmethod
+    def stripSetIndexes(stripCount):
+        """Retorna os índices dos triângulos de tiras consecutivas com stripCount vértices."""
+        offsets = np.cumsum([0] + list(stripCount[:-1]))
+        indexes = [offset + GL.stripIndexes(count-2) for offset, count in zip(offsets, stripCount)]
+        return np.concatenate(indexes) if indexes else np.empty((0, 3), dtype=int)
 
-            GL.triangleSet(order,colors)
+    @staticmethod
+    def indexedStripIndexes(index):
+        """Retorna os índices dos triângulos das tiras separadas por -1."""
+        indexes = [strip[GL.stripIndexes(len(strip)-2)] for strip in GL.splitIndexes(index)]
+        return np.concatenate(indexes) if indexes else np.empty((0, 3), dtype=int)
 
 
     @staticmethod
-    def box(size, colors):
+    def box(size, colors, solid=True):
         """Função usada para renderizar Boxes."""
         # A função box é usada para desenhar paralelepípedos na cena. O Box é centrada no
         # (0, 0, 0) no sistema de coordenadas local e alinhado com os eixos de coordenadas
@@ -488,6 +941,35 @@ class GL:
         # Exemplo de desenho de um pixel branco na coordenada 10, 10
         #gpu.GPU.draw_pixel([10, 10], gpu.GPU.RGB8, [255, 255, 255])  # altera pixel
 
+        vertices, indexes = GL.boxMesh(size)
+        GL.triangleSet(vertices[indexes].ravel(), colors, solid=solid)
+
+    # Malhas tesseladas das primitivas analíticas, chaveadas pelos seus parâmetros. O cache é
+    # limitado a MESH_CACHE_SIZE malhas, descartando as usadas há mais tempo.
+    MESH_CACHE_SIZE = 128
+    meshes = OrderedDict()
+
+    @staticmethod
+    def cachedMesh(key, tessellate):
+        """Retorna a malha (vértices, índices) do cache ou a tessela e guarda no cache."""
+        mesh = GL.meshes.pop(key, None)
+        if mesh is None:
+            mesh = tuple(np.array(array) for array in tessellate())
+            for array in mesh:
+                array.flags.writeable = False  # a mesma malha é compartilhada por várias cenas
+        GL.meshes[key] = mesh  # reinserida como a mais recente
+        while len(GL.meshes) > GL.MESH_CACHE_SIZE:
+            GL.meshes.popitem(last=False)
+        return mesh
+
+    @staticmethod
+    def boxMesh(size):
+        """Retorna os vértices e os índices dos triângulos de um Box."""
+        return GL.cachedMesh(("Box", *size), lambda: GL.tessellateBox(size))
+
+    @staticmethod
+    def tessellateBox(size):
+        """Tessela um Box em triângulos."""
         x,y,z = size[0],size[1],size[2]
         vertices = [0.5*x, 0.5*y, 0.5*z, 
                     -0.5*x, 0.5*y, 0.5*z,
@@ -505,13 +987,12 @@ class GL:
                    [3, 6, 2, -1, 6, 7, 2, -1],
                    [2, 7, 0, -1, 7, 4, 0, -1],
                    [4, 7, 5, -1, 7, 6, 5, -1]]
-        
-        for i in range(len(indexes)):
-            GL.indexedFaceSet(coord=vertices, coordIndex=indexes[i], colors=colors, colorPerVertex=False, color=None, colorIndex=[], texCoord=None, texCoordIndex=None, current_texture=None)
+
+        return np.reshape(vertices, (-1, 3)), GL.faceIndexes(sum(indexes, []))
 
     @staticmethod
     def indexedFaceSet(coord, coordIndex, colorPerVertex, color, colorIndex,
-                       texCoord, texCoordIndex, colors, current_texture):
+                       texCoord, texCoordIndex, colors, current_texture, ccw=True, solid=True):
         """Função usada para renderizar IndexedFaceSet."""
         # A função indexedFaceSet é usada para desenhar malhas de triângulos. Ela funciona de
         # forma muito simular a IndexedTriangleStripSet porém com mais recursos.
@@ -549,31 +1030,24 @@ class GL:
 
         # Exemplo de desenho de um pixel branco na coordenada 10, 10
         # gpu.GPU.draw_pixel([10, 10], gpu.GPU.RGB8, [255, 255, 255])  # altera pixel
-        for i in range(0,len(coordIndex)-3,4):
-            first = coordIndex[i]*3
-            second = coordIndex[i+1]*3
-            third = coordIndex[i+2]*3
-            
-            if len(colorIndex) > 0:
-                color1 = colorIndex[i]*3
-                color2 = colorIndex[i+1]*3
-                color3 = colorIndex[i+2]*3
-            
-            if i % 2 == 0:
-                order = [*coord[first:first+3], *coord[second:second+3], *coord[third:third+3]]
-                if len(colorIndex) > 0:
-                    order_colors = [*color[color1:color1+3], *color[color2:color2+3], *color[color3:color3+3]]
-                
-            else:
-                order = [*coord[second:second+3], *coord[first:first+3], *coord[third:third+3]]
-                if len(colorIndex) > 0:
-                    order_colors = [*color[color2:color2+3], *color[color1:color1+3], *color[color3:color3+3]]
-
-            if len(colorIndex) > 0: GL.triangleSet(order,order_colors)
-            else: GL.triangleSet(order,colors)
+        # As faces (separadas por -1) são divididas em triângulos e enviadas de uma só vez
+        vertices = np.asarray(coord, dtype=float).reshape(-1, 3)
+        order = vertices[GL.faceIndexes(coordIndex)].ravel()
+
+        if texCoord and (current_texture or colors.get("texture")):
+            # Sem texCoordIndex as coordenadas de textura seguem os índices de coordIndex
+            uv = np.asarray(texCoord, dtype=float).reshape(-1, 2)[GL.faceIndexes(texCoordIndex or coordIndex)]
+            if not colors.get("texture"):
+                colors = dict(colors, texture=current_texture[0])
+            GL.triangleSet(order, colors, ccw, solid, uv.ravel())
+        elif len(colorIndex) > 0:
+            order_colors = np.asarray(color, dtype=float).reshape(-1, 3)[GL.faceIndexes(colorIndex)].ravel()
+            GL.triangleSet(order, order_colors, ccw, solid)
+        else:
+            GL.triangleSet(order, colors, ccw, solid)
 
     @staticmethod
-    def sphere(radius, colors):
+    def sphere(radius, colors, solid=True):
         """Função usada para renderizar Esferas."""
         # A função sphere é usada para desenhar esferas na cena. O esfera é centrada no
         # (0, 0, 0) no sistema de coordenadas local. O argumento radius especifica o
@@ -584,28 +1058,195 @@ class GL:
         # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
         #print("Sphere : radius = {0}".format(radius)) # imprime no terminal o raio da esfera
         # print("Sphere : colors = {0}".format(colors)) # imprime no terminal as cores
-        coords = []
-        u, v = np.mgrid[0:2*np.pi:32j, 0:np.pi:32j]
-        x = radius*np.cos(u)*np.sin(v)
-        y = radius*np.sin(u)*np.sin(v)
-        z = radius*np.cos(v)
-        for i in range(len(x)):
-            circ = []
-            for j in range(len(x[i])):
-                circ.append([x[i,j],y[i,j],z[i,j]])
-            coords.append(circ)
-        for i in range(len(coords)-1):
-            strip_seq = []
-            strip_seq += coords[i][0]
-            strip_seq += coords[i+1][0]
-            strip_seq += coords[i][-1]
-            strip_seq += coords[i+1][-1]
-            for k in range(len(coords[i])):
-                strip_seq += coords[i][k]
-                strip_seq += coords[i+1][k]   
-            
-            index_seq = [i for i in range(len(strip_seq)//3)]
-            GL.indexedTriangleStripSet(strip_seq, index_seq, colors)
+        vertices, indexes = GL.sphereMesh(radius)
+        GL.triangleSet(vertices[indexes].ravel(), colors, solid=solid)
+
+    SPHERE_DIVISIONS = 32  # quantidade de meridianos e de paralelos das esferas
+
+    @staticmethod
+    def sphereMesh(radius, divisions=None):
+        """Retorna os vértices e os índices dos triângulos de uma esfera tesselada."""
+        divisions = divisions or GL.SPHERE_DIVISIONS
+        return GL.cachedMesh(("Sphere", radius, divisions),
+                             lambda: GL.tessellateSphere(radius, divisions))
+
+    @staticmethod
+    def tessellateSphere(radius, divisions):
+        """Tessela uma esfera em tiras de triângulos entre os meridianos."""
+        u, v = np.mgrid[0:2*np.pi:divisions*1j, 0:np.pi:divisions*1j]
+        coords = np.stack((radius*np.cos(u)*np.sin(v),
+                           radius*np.sin(u)*np.sin(v),
+                           radius*np.cos(v)), axis=-1)
+        # O último meridiano (u = 2π) repete exatamente o primeiro, sem frestas na emenda
+        coords[-1] = coords[0]
+
+        # Uma tira de triângulos entre cada par de meridianos, todas enviadas de uma só vez
+        strips = np.concatenate((coords[:-1, :1], coords[1:, :1], coords[:-1, -1:], coords[1:, -1:],
+                                 np.stack((coords[:-1], coords[1:]), axis=2).reshape(len(coords)-1, -1, 3)),
+                                axis=1)
+        offsets = np.arange(len(strips))[:, np.newaxis, np.newaxis] * strips.shape[1]
+        indexes = (offsets + GL.stripIndexes(strips.shape[1]-3)).reshape(-1, 3)
+        # As tiras ficam em sentido horário vistas de fora; a ordem é invertida para que as
+        # faces da frente (anti-horárias) sejam as externas
+        indexes = indexes[:, [0, 2, 1]]
+        return strips.reshape(-1, 3), indexes
+
+    # Malhas compiladas: as geometrias são copiadas uma única vez para buffers da GPU
+    # (como VBOs) ao se fazer o parse da cena e depois só são referenciadas por esses buffers.
+
+    @staticmethod
+    def compileMesh(vertices, indexes, vertex_colors=None, ccw=True, solid=True, vertex_uv=None,
+                    creaseAngle=0):
+        """Copia uma malha de triângulos para buffers da GPU e retorna seus identificadores."""
+        # vertices são as coordenadas (x, y, z) de cada vértice, indexes os três índices de
+        # cada triângulo e vertex_colors, opcional, uma cor (r, g, b) por vértice de triângulo.
+        # vertex_uv, também opcional, tem uma coordenada de textura (u, v) por vértice de
+        # triângulo. ccw e solid (que no X3D não mudam depois da leitura) ficam guardados
+        # com a malha. As normais de cada vértice de triângulo, usadas na iluminação, são
+        # calculadas aqui uma única vez, suavizadas conforme creaseAngle.
+        vertex_buffer, index_buffer, color_buffer, uv_buffer, normal_buffer = gpu.GPU.gen_buffers(5)
+        gpu.GPU.buffer_data(vertex_buffer, np.asarray(vertices, dtype=float).reshape(-1, 3), float)
+        gpu.GPU.buffer_data(index_buffer, np.asarray(indexes, dtype=int).reshape(-1, 3), int)
+        corners = gpu.GPU.get_buffer(vertex_buffer)[gpu.GPU.get_buffer(index_buffer)].reshape(-1, 3)
+        gpu.GPU.buffer_data(normal_buffer, GL.vertexNormals(corners, creaseAngle, ccw), float)
+        if vertex_colors is None:
+            color_buffer = None
+        else:
+            gpu.GPU.buffer_data(color_buffer, np.asarray(vertex_colors, dtype=float).reshape(-1, 3), float)
+        if vertex_uv is None:
+            uv_buffer = None
+        else:
+            gpu.GPU.buffer_data(uv_buffer, np.asarray(vertex_uv, dtype=float).reshape(-1, 2), float)
+        return {"vertex": vertex_buffer, "index": index_buffer, "color": color_buffer, "uv": uv_buffer,
+                "normal": normal_buffer, "ccw": ccw, "solid": solid, "bounds": GL.boundingBox(corners)}
+
+    @staticmethod
+    def boundingBox(vertices):
+        """Retorna os 8 cantos (em coordenadas homogêneas) da caixa alinhada aos eixos dos vértices."""
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        if len(vertices) == 0:
+            return None
+        limits = np.stack((vertices.min(axis=0), vertices.max(axis=0)))
+        corners = limits[np.indices((2, 2, 2)).reshape(3, -1), np.arange(3)[:, np.newaxis]]
+        return np.vstack((corners, np.ones(8)))
+
+    @staticmethod
+    def outside(bounds):
+        """Verifica se a caixa envolvente está toda fora do campo de visão (e da região de desenho)."""
+        # Os cantos são levados para o espaço de recorte (antes da divisão homogênea), onde os
+        # limites do campo de visão são planos; a forma é descartada se todos os cantos estão
+        # do lado de fora de um mesmo plano. A região considerada tem 1 pixel de folga.
+        x, y, z, w = np.matmul(np.matmul(GL.projected, GL.transformed.peek()), bounds)
+        x0, y0, x1, y1 = GL.scissor
+        return bool(np.all(w <= 0) or np.all(z > w) or
+                    np.all(x < (x0 - 1) * w) or np.all(x > (x1 + 1) * w) or
+                    np.all(y < (y0 - 1) * w) or np.all(y > (y1 + 1) * w))
+
+    @staticmethod
+    def screenBounds(bounds):
+        """Retorna a região (x0, y0, x1, y1) da tela coberta pela caixa envolvente."""
+        # Retorna None se a caixa está fora do campo de visão; se ela cruza o plano próximo a
+        # projeção não é limitada e é retornada a tela toda
+        if GL.outside(bounds):
+            return None
+        x, y, _, w = np.matmul(np.matmul(GL.projected, GL.transformed.peek()), bounds)
+        if np.any(w < GL.near):
+            return (0, 0, GL.width, GL.height)
+        x, y = x / w, y / w
+        # Um pixel de folga em cada lado para os arredondamentos do rasterizador
+        return (max(int(np.floor(x.min())) - 1, 0), max(int(np.floor(y.min())) - 1, 0),
+                min(int(np.floor(x.max())) + 2, GL.width), min(int(np.floor(y.max())) + 2, GL.height))
+
+    @staticmethod
+    def record(function, *args, mesh=None):
+        """Grava um desenho do quadro atual, para ser executado depois com replay."""
+        # Desenhos de malhas compiladas guardam também a região da tela que cobrem e uma
+        # assinatura (matriz, cores e luzes) que muda quando a forma se move, muda de cor ou
+        # as luzes mudam; os demais desenhos não podem ser acompanhados (key None).
+        command = {"draw": (function, args), "matrix": GL.transformed.peek(),
+                   "key": None, "signature": None, "region": None}
+        if mesh is not None:
+            command["key"] = id(mesh)
+            command["signature"] = (np.matmul(GL.projected, command["matrix"]).tobytes(), repr(args[1]),
+                                    repr(GL.lights))
+            command["region"] = None if mesh["bounds"] is None else GL.screenBounds(mesh["bounds"])
+        GL.commands.append(command)
+
+    @staticmethod
+    def replay(commands):
+        """Executa os desenhos gravados com record (limitados pela região de GL.scissor)."""
+        for command in commands:
+            function, args = command["draw"]
+            GL.transformed.push(command["matrix"])
+            function(*args)
+            GL.transformed.pop()
+
+    @staticmethod
+    def compileTriangleSet(point, ccw=True, solid=True):
+        """Compila um TriangleSet em buffers da GPU."""
+        count = len(point) // 9
+        return GL.compileMesh(np.asarray(point[:count*9]), np.arange(count*3), ccw=ccw, solid=solid)
+
+    @staticmethod
+    def compileTriangleStripSet(point, stripCount, ccw=True, solid=True):
+        """Compila um TriangleStripSet em buffers da GPU."""
+        return GL.compileMesh(point, GL.stripSetIndexes(stripCount), ccw=ccw, solid=solid)
+
+    @staticmethod
+    def compileIndexedTriangleStripSet(point, index, ccw=True, solid=True):
+        """Compila um IndexedTriangleStripSet em buffers da GPU."""
+        return GL.compileMesh(point, GL.indexedStripIndexes(index), ccw=ccw, solid=solid)
+
+    @staticmethod
+    def compileIndexedFaceSet(coord, coordIndex, color, colorIndex, ccw=True, solid=True,
+                              texCoord=None, texCoordIndex=None, creaseAngle=0):
+        """Compila um IndexedFaceSet em buffers da GPU."""
+        vertex_colors = vertex_uv = None
+        if len(colorIndex) > 0:
+            vertex_colors = np.asarray(color, dtype=float).reshape(-1, 3)[GL.faceIndexes(colorIndex)]
+        if texCoord:
+            # Sem texCoordIndex as coordenadas de textura seguem os índices de coordIndex
+            vertex_uv = np.asarray(texCoord, dtype=float).reshape(-1, 2)[GL.faceIndexes(texCoordIndex or coordIndex)]
+        return GL.compileMesh(coord, GL.faceIndexes(coordIndex), vertex_colors, ccw, solid, vertex_uv,
+                              creaseAngle)
+
+    @staticmethod
+    def compileBox(size, solid=True):
+        """Compila um Box em buffers da GPU."""
+        return GL.compileMesh(*GL.boxMesh(size), solid=solid)
+
+    @staticmethod
+    def compileSphere(radius, solid=True):
+        """Compila uma esfera em buffers da GPU."""
+        # As normais da esfera são suavizadas em todos os vértices
+        return GL.compileMesh(*GL.sphereMesh(radius), solid=solid, creaseAngle=np.pi)
+
+    @staticmethod
+    def drawMesh(mesh, colors):
+        """Desenha uma malha compilada com compileMesh."""
+        if GL.commands is not None:  # quadro sendo gravado para redesenho parcial (ver record)
+            GL.record(GL.drawMesh, mesh, colors, mesh=mesh)
+            return
+        # Formas fora do campo de visão são descartadas antes de qualquer operação nos vértices
+        if mesh["bounds"] is None or GL.outside(mesh["bounds"]):
+            GL.culled += 1
+            return
+        vertices = gpu.GPU.get_buffer(mesh["vertex"])
+        indexes = gpu.GPU.get_buffer(mesh["index"])
+        if len(indexes) == 0:
+            return
+        if mesh["uv"] is not None and colors.get("texture"):
+            # A textura substitui as cores dos vértices
+            GL.triangleSet(vertices[indexes].ravel(), colors, mesh["ccw"], mesh["solid"],
+                           gpu.GPU.get_buffer(mesh["uv"]))
+            return
+        if mesh["color"] is not None:
+            if colors.get("lighting"):  # com Material as cores dos vértices são as cores difusas
+                colors = dict(colors, diffuseColor=gpu.GPU.get_buffer(mesh["color"]))
+            else:
+                colors = gpu.GPU.get_buffer(mesh["color"])
+        GL.triangleSet(vertices[indexes].ravel(), colors, mesh["ccw"], mesh["solid"],
+                       normal=gpu.GPU.get_buffer(mesh["normal"]))
 
     @staticmethod
     def navigationInfo(headlight):
@@ -617,7 +1258,15 @@ class GL:
         # ambientIntensity = 0,0 e direção = (0 0 −1).
 
         # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("NavigationInfo : headlight = {0}".format(headlight)) # imprime no terminal
+        #print("NavigationInfo : headlight = {0}".format(headlight)) # imprime no terminal
+
+        # O NavigationInfo é tratado logo após o Viewpoint em todo quadro, antes das luzes,
+        # então as luzes do quadro anterior são descartadas aqui
+        GL.lights = []
+        if headlight:
+            # A direção (0 0 -1) da câmera levada para o mundo
+            GL.lights.append({"ambientIntensity": 0.0, "color": np.ones(3), "intensity": 1.0,
+                              "direction": -GL.camera_rotation[:3, 2], "location": None})
 
     @staticmethod
     def directionalLight(ambientIntensity, color, intensity, direction):
@@ -629,13 +1278,19 @@ class GL:
         # longo de raios paralelos de uma distância infinita.
 
         # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("DirectionalLight : ambientIntensity = {0}".format(ambientIntensity))
-        print("DirectionalLight : color = {0}".format(color)) # imprime no terminal
-        print("DirectionalLight : intensity = {0}".format(intensity)) # imprime no terminal
-        print("DirectionalLight : direction = {0}".format(direction)) # imprime no terminal
+        #print("DirectionalLight : ambientIntensity = {0}".format(ambientIntensity))
+        #print("DirectionalLight : color = {0}".format(color)) # imprime no terminal
+        #print("DirectionalLight : intensity = {0}".format(intensity)) # imprime no terminal
+        #print("DirectionalLight : direction = {0}".format(direction)) # imprime no terminal
+
+        # As luzes são guardadas em coordenadas do mundo
+        direction = np.matmul(GL.transformed.peek()[:3, :3], np.asarray(direction, dtype=float))
+        GL.lights.append({"ambientIntensity": ambientIntensity, "color": np.asarray(color, dtype=float),
+                          "intensity": intensity, "direction": direction / np.linalg.norm(direction),
+                          "location": None})
 
     @staticmethod
-    def pointLight(ambientIntensity, color, intensity, location):
+    def pointLight(ambientIntensity, color, intensity, location, attenuation=(1, 0, 0), radius=100):
         """Luz pontual."""
         # Fonte de luz pontual em um local 3D no sistema de coordenadas local. Uma fonte
         # de luz pontual emite luz igualmente em todas as direções; ou seja, é omnidirecional.
@@ -644,10 +1299,177 @@ class GL:
         # zero. A iluminação do nó PointLight diminui com a distância especificada.
 
         # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("PointLight : ambientIntensity = {0}".format(ambientIntensity))
-        print("PointLight : color = {0}".format(color)) # imprime no terminal
-        print("PointLight : intensity = {0}".format(intensity)) # imprime no terminal
-        print("PointLight : location = {0}".format(location)) # imprime no terminal
+        #print("PointLight : ambientIntensity = {0}".format(ambientIntensity))
+        #print("PointLight : color = {0}".format(color)) # imprime no terminal
+        #print("PointLight : intensity = {0}".format(intensity)) # imprime no terminal
+        #print("PointLight : location = {0}".format(location)) # imprime no terminal
+
+        location = np.matmul(GL.transformed.peek(), np.append(np.asarray(location, dtype=float), 1))
+        GL.lights.append({"ambientIntensity": ambientIntensity, "color": np.asarray(color, dtype=float),
+                          "intensity": intensity, "direction": None, "location": location[:3],
+                          "attenuation": np.asarray(attenuation, dtype=float), "radius": radius})
+
+    # Modos de iluminação: gouraud calcula as cores nos vértices e as interpola nos pixels,
+    # phong interpola as normais e calcula a iluminação em cada pixel (melhor e mais lento) e
+    # deferred grava as normais e cores no G-buffer e ilumina cada pixel visível uma única vez
+    SHADINGS = ("gouraud", "phong", "deferred")
+    SHADING = "gouraud"
+    materials = []      # materiais do G-buffer no quadro atual (o identificador é índice + 1)
+    material_ids = {}   # identificador de cada material do quadro atual
+
+    @staticmethod
+    def materialId(material):
+        """Retorna o identificador no G-buffer do material, registrando-o se for novo."""
+        # Só os campos usados na iluminação diferenciam os materiais (a cor difusa vai no G-buffer)
+        key = (tuple(np.ravel(material["emissiveColor"])), tuple(np.ravel(material["specularColor"])),
+               material["shininess"], material.get("ambientIntensity", 0.2), material.get("solid", True))
+        if key not in GL.material_ids:
+            GL.materials.append(material)
+            GL.material_ids[key] = len(GL.materials)
+        return GL.material_ids[key]
+
+    @staticmethod
+    def deferredLighting(coords=None):
+        """Passada de iluminação do shading deferred sobre os pixels gravados no G-buffer."""
+        # Sem coords ilumina toda a região de desenho (GL.scissor) ao final do quadro; com
+        # coords só esses pixels (ex.: antes de misturar uma forma transparente sobre eles).
+        # Os pixels iluminados deixam de ter material, então cada um é iluminado uma vez.
+        if not GL.materials:
+            return
+        gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DEPTH)
+        frame = coords is None
+        if frame:
+            x0, y0, x1, y1 = GL.scissor
+            y, x = np.mgrid[max(y0, 0):min(y1, GL.height), max(x0, 0):min(x1, GL.width)]
+            coords = np.column_stack((x.ravel(), y.ravel()))
+        ids = gpu.GPU.read_pixels(coords, gpu.GPU.MATERIAL32I)[:, 0]
+        coords, ids = coords[ids > 0], ids[ids > 0]
+
+        if len(coords):
+            # Posições no mundo reconstruídas da profundidade pela inversa da projeção
+            Z = gpu.GPU.read_pixels(coords, gpu.GPU.DEPTH_COMPONENT32F)[:, 0]
+            screen = np.column_stack((coords, Z, np.ones(len(Z))))
+            world = np.linalg.inv(GL.projected) @ screen.T
+            positions = (world[:3] / world[3]).T
+            normals = gpu.GPU.read_pixels(coords, gpu.GPU.NORMAL32F).astype(float)
+            albedo = gpu.GPU.read_pixels(coords, gpu.GPU.ALBEDO32F).astype(float)
+
+            # Todas as luzes avaliadas de uma vez nos pixels de cada material
+            color = np.empty((len(coords), 3))
+            for material_id in np.unique(ids):
+                pixels = ids == material_id
+                color[pixels] = GL.light(positions[pixels], normals[pixels], albedo[pixels],
+                                         GL.materials[material_id - 1])
+            gpu.GPU.draw_pixels(coords, gpu.GPU.MATERIAL32I, 0)
+            gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DRAW)
+            gpu.GPU.draw_pixels(coords, gpu.GPU.RGB8, np.clip(color * 255, 0, 255))
+        gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, GL.DRAW)
+
+        # Ao final do quadro todos os pixels foram iluminados e os materiais são descartados
+        if frame:
+            GL.materials = []
+            GL.material_ids = {}
+
+    @staticmethod
+    def light(positions, normals, diffuse, material):
+        """Modelo de iluminação do X3D avaliado de uma só vez em todos os pontos e luzes."""
+        # positions e normals são as posições e normais dos pontos no mundo e diffuse a cor
+        # difusa de cada ponto; material é o dicionário de cores do material (com "solid").
+        # Retorna a cor (r, g, b) de cada ponto, entre 0 e 1.
+        emissive = np.asarray(material["emissiveColor"], dtype=float)
+        if not GL.lights:
+            return np.broadcast_to(emissive, positions.shape)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+            view = GL.camera - positions
+            view /= np.linalg.norm(view, axis=1, keepdims=True)
+        normals, view = np.nan_to_num(normals), np.nan_to_num(view)
+        if not material.get("solid", True):
+            # Sem solid as faces de costas são iluminadas pelo outro lado
+            normals = np.where((np.sum(normals * view, axis=1) < 0)[:, np.newaxis], -normals, normals)
+
+        # Direção até cada luz (k luzes x n pontos) e atenuação das luzes pontuais
+        lights = GL.lights
+        directions = np.empty((len(lights),) + positions.shape)
+        attenuation = np.ones(directions.shape[:2])
+        directional = np.array([light["location"] is None for light in lights])
+        if directional.any():
+            directions[directional] = -np.array([light["direction"] for light in lights
+                                                 if light["location"] is None])[:, np.newaxis]
+        if not directional.all():
+            points = [light for light in lights if light["location"] is not None]
+            offset = np.array([light["location"] for light in points])[:, np.newaxis] - positions
+            distance = np.linalg.norm(offset, axis=2)
+            factors = np.array([light["attenuation"] for light in points])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                directions[~directional] = np.nan_to_num(offset / distance[:, :, np.newaxis])
+                attenuation[~directional] = np.where(
+                    distance <= np.array([light["radius"] for light in points])[:, np.newaxis],
+                    1 / np.maximum(factors[:, :1] + factors[:, 1:2] * distance + factors[:, 2:] * distance**2, 1),
+                    0)
+
+        # Termos ambiente, difuso e especular de cada luz
+        color = np.array([light["color"] for light in lights])[:, np.newaxis]
+        intensity = np.array([light["intensity"] for light in lights])[:, np.newaxis, np.newaxis]
+        ambient = np.array([light["ambientIntensity"] for light in lights])[:, np.newaxis, np.newaxis]
+        lambert = np.einsum('kni,ni->kn', directions, normals)[:, :, np.newaxis]
+        halfway = directions + view
+        with np.errstate(divide='ignore', invalid='ignore'):
+            halfway /= np.linalg.norm(halfway, axis=2, keepdims=True)
+        highlight = np.maximum(np.nan_to_num(np.einsum('kni,ni->kn', halfway, normals)), 0)[:, :, np.newaxis]
+        specular = np.where(lambert > 0, highlight ** (material["shininess"] * 128), 0)
+
+        terms = (ambient * material.get("ambientIntensity", 0.2) * diffuse +
+                 intensity * np.maximum(lambert, 0) * diffuse +
+                 intensity * specular * np.asarray(material["specularColor"], dtype=float))
+        return np.clip(emissive + np.sum(attenuation[:, :, np.newaxis] * color * terms, axis=0), 0, 1)
+
+    @staticmethod
+    def vertexNormals(vertices, creaseAngle=0, ccw=True):
+        """Calcula as normais de todos os vértices dos triângulos de uma só vez."""
+        # vertices tem os vértices de 3 em 3 formando os triângulos. Os vértices na mesma
+        # posição recebem a média (ponderada pela área) das normais das faces que formam com
+        # a sua um ângulo menor que creaseAngle; com creaseAngle 0 ficam as normais das faces.
+        triangles = np.asarray(vertices, dtype=float).reshape(-1, 3, 3)
+        faces = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        if not ccw:
+            faces = -faces
+        with np.errstate(divide='ignore', invalid='ignore'):
+            units = np.nan_to_num(faces / np.linalg.norm(faces, axis=1, keepdims=True))
+        if creaseAngle <= 0 or len(triangles) == 0:
+            return np.repeat(units, 3, axis=0)
+
+        # Pares de vértices na mesma posição (agrupados após arredondar as coordenadas)
+        corners = triangles.reshape(-1, 3)
+        scale = max(np.abs(corners).max(), np.finfo(float).tiny)
+        _, group = np.unique(np.round(corners / scale, 9), axis=0, return_inverse=True)
+        group = group.ravel()
+        order = np.argsort(group, kind="stable")
+        counts = np.bincount(group)
+        size = counts[group]
+        first = np.repeat(np.arange(len(corners)), size)
+        rank = np.arange(len(first)) - np.repeat(np.cumsum(size) - size, size)
+        second = order[np.repeat((np.cumsum(counts) - counts)[group], size) + rank]
+
+        # Soma das normais das faces vizinhas dentro do ângulo de vinco
+        smooth = np.einsum('ij,ij->i', units[first // 3], units[second // 3]) >= np.cos(creaseAngle) - 1e-9
+        normals = np.zeros_like(corners)
+        np.add.at(normals, first[smooth], faces[second[smooth] // 3])
+        length = np.linalg.norm(normals, axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(length > 0, normals / length, np.repeat(units, 3, axis=0))
+
+    @staticmethod
+    def worldNormals(normals):
+        """Leva as normais para o mundo com a inversa transposta da matriz do modelo."""
+        model = GL.transformed.peek()[:3, :3]
+        try:
+            normals = np.matmul(normals, np.linalg.inv(model))
+        except np.linalg.LinAlgError:  # escala nula: a forma não aparece
+            return normals
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.nan_to_num(normals / np.linalg.norm(normals, axis=1, keepdims=True))
 
     @staticmethod
     def fog(visibilityRange, color):
@@ -683,6 +1505,8 @@ class GL:
 
         # Esse método já está implementado para os alunos como exemplo
         epoch = time.time()  # time in seconds since the epoch as a floating point number.
+        if GL.frame_time is not None:  # instante fixo do quadro (ex.: renderização paralela)
+            epoch = GL.frame_time
         fraction_changed = (epoch % cycleInterval) / cycleInterval
 
         return fraction_changed
@@ -10,6 +10,12 @@ Data: 31 de Agosto de 2020
 """
 
 import os           # Para rotinas do sistema operacional
+import atexit       # Para liberar recursos ao encerrar o programa
+import hashlib      # Para os nomes dos arquivos do cache de texturas
+import tempfile     # Para gravar os arquivos do cache de texturas
+
+from collections import OrderedDict  # Para o cache das texturas
+from multiprocessing import shared_memory  # Memória compartilhada entre processos
 
 # Numpy
 import numpy as np
@@ -17,6 +23,8 @@ import numpy as np
 # Pillow
 from PIL import Image
 
+import gravador     # Grava as imagens em segundo plano
+
 class FrameBuffer:
     """Organiza objetos FrameBuffer (FrameBuffer Objects)."""
 
@@ -24,6 +32,10 @@ class FrameBuffer:
         """Iniciando propriedades do FramBuffer."""
         self.color = np.empty(0)
         self.depth = np.empty(0)
+        self.normal = np.empty(0)    # G-buffer: normais no mundo
+        self.albedo = np.empty(0)    # G-buffer: cores difusas
+        self.material = np.empty(0)  # G-buffer: identificadores dos materiais
+        self.shared = {}  # Memórias compartilhadas entre processos (por attachment)
 
 
 class GPU:
@@ -38,22 +50,63 @@ class GPU:
     RGBA8 = 0b010  # Valores para Vermelho, Verde, Azul e Transpareência de 8bits cada (0-255)
     DEPTH_COMPONENT16 = 0b101  # Valores para Profundidade de 16bits cada (0-65535)
     DEPTH_COMPONENT32F = 0b110  # Valores para Profundidade de 32bits em float
+    NORMAL32F = 0b011  # Valores x, y, z de normais em float de 32bits cada
+    ALBEDO32F = 0b100  # Valores para Vermelho, Verde, Azul em float de 32bits cada (0-1)
+    MATERIAL32I = 0b111  # Identificadores de materiais inteiros de 32bits (0 é nenhum)
 
     COLOR_ATTACHMENT = 0  # Para FrameBuffer Object identificar memória de imagem de cores
     DEPTH_ATTACHMENT = 1  # Para FrameBuffer Object identificar memória de imagem de profundidade
+    NORMAL_ATTACHMENT = 2  # Para FrameBuffer Object identificar memória de normais (G-buffer)
+    ALBEDO_ATTACHMENT = 3  # Para FrameBuffer Object identificar memória de cores difusas (G-buffer)
+    MATERIAL_ATTACHMENT = 4  # Para FrameBuffer Object identificar memória de materiais (G-buffer)
+
+    # Atributo do FrameBuffer, nome do canal e modos de leitura e escrita de cada attachment
+    ATTACHMENTS = {
+        COLOR_ATTACHMENT: ("color", "cor", (RGB8, RGBA8)),
+        DEPTH_ATTACHMENT: ("depth", "profundidade", (DEPTH_COMPONENT16, DEPTH_COMPONENT32F)),
+        NORMAL_ATTACHMENT: ("normal", "normal", (NORMAL32F,)),
+        ALBEDO_ATTACHMENT: ("albedo", "albedo", (ALBEDO32F,)),
+        MATERIAL_ATTACHMENT: ("material", "material", (MATERIAL32I,)),
+    }
+
+    BOX_FILTER = 0  # Média simples das amostras de cada pixel na redução de resolução
+    TENT_FILTER = 1  # Média ponderada (triangular) incluindo amostras dos pixels vizinhos
 
     # Atributos estáticos
     image_file = None
     frame_buffer = None
+    buffers = None
     path = "."
+    shared_owner = None  # processo que alocou as memórias compartilhadas
+    writer = None  # grava as imagens em arquivos em segundo plano
+
+    # Texturas decodificadas com seus mipmaps (8bits por canal), chaveadas pelo arquivo e
+    # sua data de modificação. O cache é limitado a TEXTURE_CACHE_BYTES bytes, contando todos
+    # os níveis, e descarta as usadas há mais tempo. Com TEXTURE_CACHE_DIR as texturas e os
+    # mipmaps também são gravados nessa pasta (.npy) e lidos por mapeamento de memória, sendo
+    # compartilhados entre os processos.
+    TEXTURE_CACHE_BYTES = 256 << 20
+    TEXTURE_CACHE_DIR = None
+    textures = OrderedDict()
+    textures_bytes = 0
 
     def __init__(self, image_file, path):
         """Define o nome do arquivo para caso se salvar o framebuffer."""
         GPU.image_file = image_file
 
+        # Libera memórias compartilhadas de uma configuração anterior
+        GPU.release_shared()
+
+        # Termina de gravar as imagens pendentes e recomeça as sequências de arquivos
+        GPU.close_writer()
+        GPU.writer = gravador.Gravador()
+
         # Inicia lista para objetos Frame Buffer
         GPU.frame_buffer = []
 
+        # Inicia lista para buffers de vértices, índices e cores (Buffer Objects)
+        GPU.buffers = []
+
         # Define buffers de leitura e escrita
         GPU.draw_framebuffer = 0
         GPU.read_framebuffer = 0
@@ -75,6 +128,34 @@ class GPU:
             allocated += [len(GPU.frame_buffer)-1]  # informado a posição recem alocada
         return allocated
 
+    @staticmethod
+    def gen_buffers(size):
+        """Gera posições para buffers de dados das geometrias."""
+        allocated = []
+        for _ in range(size):
+            GPU.buffers.append(np.empty(0))
+            allocated += [len(GPU.buffers)-1]  # informado a posição recem alocada
+        return allocated
+
+    @staticmethod
+    def buffer_data(position, data, dtype):
+        """Copia os dados para o buffer especificado."""
+        # Os dados ficam contíguos e somente para leitura, como em um buffer da GPU
+        buffer = np.array(data, dtype=dtype, order="C")
+        buffer.flags.writeable = False
+        GPU.buffers[position] = buffer
+
+    @staticmethod
+    def get_buffer(position):
+        """Retorna os dados do buffer especificado."""
+        return GPU.buffers[position]
+
+    @staticmethod
+    def delete_buffers(positions):
+        """Libera a memória dos buffers especificados."""
+        for position in positions:
+            GPU.buffers[position] = np.empty(0)
+
     @staticmethod
     def bind_framebuffer(buffer, position):
         """Define o framebuffer a ser usado e como."""
@@ -87,8 +168,10 @@ class GPU:
             GPU.read_framebuffer = position
 
     @staticmethod
-    def framebuffer_storage(position, attachment, mode, width, height):
+    def framebuffer_storage(position, attachment, mode, width, height, shared=False):
         """Aloca o FrameBuffer especificado."""
+        # Com shared a memória é alocada em uma região compartilhada entre processos, assim
+        # processos criados (fork) depois da alocação escrevem diretamente no mesmo FrameBuffer.
         if attachment == GPU.COLOR_ATTACHMENT:
             if mode == GPU.RGB8:
                 dtype = np.uint8
@@ -97,7 +180,7 @@ class GPU:
                 dtype = np.uint8
                 depth = 4
             # Aloca espaço definindo todos os valores como 0 (imagem preta)
-            GPU.frame_buffer[position].color = np.zeros((height, width, depth), dtype=dtype)
+            GPU.frame_buffer[position].color = GPU._allocate(position, attachment, (height, width, depth), dtype, 0, shared)
         elif attachment == GPU.DEPTH_ATTACHMENT:
             if mode == GPU.DEPTH_COMPONENT16:
                 dtype = np.uint16
@@ -106,7 +189,51 @@ class GPU:
                 dtype = np.float32
                 depth = 1
             # Aloca espaço definindo todos os valores como 1 (profundidade máxima)
-            GPU.frame_buffer[position].depth = np.ones((height, width, depth), dtype=dtype)
+            GPU.frame_buffer[position].depth = GPU._allocate(position, attachment, (height, width, depth), dtype, 1, shared)
+        elif attachment in (GPU.NORMAL_ATTACHMENT, GPU.ALBEDO_ATTACHMENT):
+            # Aloca espaço definindo todos os valores (x, y, z ou r, g, b) como 0
+            data = GPU._allocate(position, attachment, (height, width, 3), np.float32, 0, shared)
+            setattr(GPU.frame_buffer[position], GPU.ATTACHMENTS[attachment][0], data)
+        elif attachment == GPU.MATERIAL_ATTACHMENT:
+            # Aloca espaço definindo todos os valores como 0 (nenhum material)
+            GPU.frame_buffer[position].material = GPU._allocate(position, attachment, (height, width, 1), np.int32, 0, shared)
+
+    @staticmethod
+    def _allocate(position, attachment, shape, dtype, value, shared):
+        """Aloca a memória de um attachment, opcionalmente compartilhada entre processos."""
+        GPU._release(GPU.frame_buffer[position], attachment)
+        if not shared:
+            return np.full(shape, value, dtype=dtype)
+
+        GPU.shared_owner = os.getpid()
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        GPU.frame_buffer[position].shared[attachment] = memory
+        data = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        data[:] = value
+        return data
+
+    @staticmethod
+    def _release(fbo, attachment):
+        """Libera a memória compartilhada de um attachment, se houver."""
+        memory = fbo.shared.pop(attachment, None)
+        if memory is not None:
+            setattr(fbo, GPU.ATTACHMENTS[attachment][0], np.empty(0))
+            try:
+                memory.close()
+            except BufferError:  # ainda há referências ao vetor, o sistema libera depois
+                pass
+            memory.unlink()
+
+    @staticmethod
+    def release_shared():
+        """Libera todas as memórias compartilhadas dos FrameBuffers."""
+        # Somente o processo que alocou as memórias pode liberá-las
+        if GPU.shared_owner != os.getpid():
+            return
+        for fbo in GPU.frame_buffer or []:
+            for attachment in list(fbo.shared):
+                GPU._release(fbo, attachment)
 
     @staticmethod
     def clear_color(color):
@@ -119,128 +246,320 @@ class GPU:
         GPU.clear_depth_val = depth
 
     @staticmethod
-    def clear_buffer():
+    def clear_buffer(region=None):
         """Usa o mesmo valor em todo o FrameBuffer, na prática apagando ele."""
+        # Com region (x0, y0, x1, y1) somente essa região do FrameBuffer é apagada
+        area = np.s_[:] if region is None else np.s_[region[1]:region[3], region[0]:region[2]]
         if GPU.frame_buffer[GPU.draw_framebuffer].color.size != 0:
-            GPU.frame_buffer[GPU.draw_framebuffer].color[:] = GPU.clear_color_val
+            GPU.frame_buffer[GPU.draw_framebuffer].color[area] = GPU.clear_color_val
         if GPU.frame_buffer[GPU.draw_framebuffer].depth.size != 0:
-            GPU.frame_buffer[GPU.draw_framebuffer].depth[:] = GPU.clear_depth_val
+            GPU.frame_buffer[GPU.draw_framebuffer].depth[area] = GPU.clear_depth_val
+        # Os attachments do G-buffer são apagados com zeros (sem material)
+        for attachment in ("normal", "albedo", "material"):
+            data = getattr(GPU.frame_buffer[GPU.draw_framebuffer], attachment)
+            if data.size != 0:
+                data[area] = 0
 
     @staticmethod
-    def draw_pixel(coord, mode, data):
-        """Define o valor do pixel no framebuffer."""
-        if coord and np.any(data):
-            if mode in (GPU.RGB8, GPU.RGBA8):  # cores
+    def _attachment(position, mode):
+        """Retorna a memória do FrameBuffer informado conforme o modo (cor, profundidade, ...)."""
+        for field, name, modes in GPU.ATTACHMENTS.values():
+            if mode in modes:
+                #  Verifica se o Framebuffer do canal foi alocado
+                data = getattr(GPU.frame_buffer[position], field)
+                if data.size == 0:
+                    raise Exception(f"Frame buffer {position} não alocado para o canal de {name}")
+                return data
+        raise Exception(f"Modo inválido de leitura do Frame buffer ({mode})")
 
-                #  Verifica se o Framebuffer do canal de cor foi alocado
-                if GPU.frame_buffer[GPU.draw_framebuffer].color.size != 0:
+    @staticmethod
+    def _check_coords(coords, fb_dim, operation):
+        """Verifica se todas as coordenadas [x, y] estão dentro do Framebuffer."""
+        if coords.size == 0:
+            return
+        outside = (coords[:, 0] < 0) | (coords[:, 0] >= fb_dim[1]) | \
+                  (coords[:, 1] < 0) | (coords[:, 1] >= fb_dim[0])
+        if np.any(outside):
+            coord = coords[np.argmax(outside)]
+            raise Exception(f"Acesso irregular de {operation} na posição [{coord[0]}, {coord[1]}] do Framebuffer {fb_dim[1], fb_dim[0]}")
 
-                    # Coleta a dimensão do Framebuffer para o canal de cor
-                    fb_dim = GPU.frame_buffer[GPU.draw_framebuffer].color.shape
+    @staticmethod
+    def draw_pixels(coords, mode, data, mask=None):
+        """Define o valor de vários pixels no framebuffer de uma só vez."""
+        # coords é um vetor (N, 2) com as posições [x, y] dos pixels, data é um vetor com
+        # N valores (ou um único valor usado em todos os pixels) e mask um vetor booleano
+        # opcional de N posições indicando quais pixels devem realmente ser escritos.
+        # A validação é feita uma única vez para todo o lote.
+        buffer = GPU._attachment(GPU.draw_framebuffer, mode)
+
+        coords = np.asarray(coords).reshape(-1, 2)
+        data = np.asarray(data)
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool).reshape(-1)
+            coords = coords[mask]
+            # Dados por pixel também precisam ser filtrados pela máscara
+            per_pixel = data.ndim == 2 or (buffer.shape[2] == 1 and data.shape[:1] == mask.shape)
+            if per_pixel:
+                data = data[mask]
+        if coords.shape[0] == 0:
+            return
+
+        # Verifica se escrita é em um local válido
+        coords = coords.astype(np.intp, copy=False)
+        GPU._check_coords(coords, buffer.shape, "escrita")
+
+        if mode in (GPU.RGB8, GPU.RGBA8):  # cores
+            # Verifica se os dados estão no tamanho certo e em uma faixa suportada
+            if data.shape[-1:] != (mode+2,) or data.ndim > 2 or \
+               not np.issubdtype(data.dtype, np.number) or not np.all((data >= 0) & (data <= 255)):
+                raise Exception(f"Valores do Frame buffer devem estar em um vetor de dimensão [{mode+2}] ser inteiros e estar entre 0 e 255")
+        elif buffer.shape[2] != 1:  # normais e cores difusas em float
+            # Verifica se os dados estão no tamanho certo e em um formato suportado
+            if data.shape[-1:] != (buffer.shape[2],) or data.ndim > 2 or not np.issubdtype(data.dtype, np.number):
+                raise Exception(f"Valores do Frame buffer devem estar em um vetor numérico de dimensão [{buffer.shape[2]}]")
+        else:  # profundidade e materiais
+            # Verifica se os dados estão no tamanho certo e em um formato suportado
+            if data.ndim > 1 and data.shape[-1] == 1:
+                data = data.reshape(data.shape[:-1])
+            if data.ndim > 1 or not np.issubdtype(data.dtype, np.number):
+                raise Exception(f"Valores do Frame buffer devem ser um vetor com um único valor numérico: {data}")
+            data = data[..., np.newaxis]
+
+        # Grava dados no Framebuffer
+        buffer[coords[:, 1], coords[:, 0]] = data
 
-                    # Verifica se escrita é em um local válido
-                    if coord[0] < 0 or coord[0] >= fb_dim[1] or coord[1] < 0 or coord[1] >= fb_dim[0]:
-                        raise Exception(f"Acesso irregular de escrita na posição [{coord[0]}, {coord[1]}] do Framebuffer {fb_dim[1], fb_dim[0]}")
+    @staticmethod
+    def read_pixels(coords, mode):
+        """Retorna os valores de vários pixels do framebuffer de uma só vez."""
+        buffer = GPU._attachment(GPU.read_framebuffer, mode)
 
-                    # Verifica se os dados estão no tamanho certo e em uma faixa suportada
-                    if isinstance(data, (list, tuple, np.ndarray)) and (len(data) == (mode+2)) and all( 0 <= i <= 255 for i in data):
-                        # Grava dados no Framebuffer
-                        GPU.frame_buffer[GPU.draw_framebuffer].color[coord[1]][coord[0]] = data
-                    else:
-                        raise Exception(f"Valores do Frame buffer devem estar em um vetor de dimensão [{mode+2}] ser inteiros e estar entre 0 e 255")
-                else:
-                    raise Exception(f"Frame buffer {GPU.draw_framebuffer} não alocado para o canal de cor")
+        coords = np.asarray(coords).reshape(-1, 2).astype(np.intp, copy=False)
 
-            elif mode in (GPU.DEPTH_COMPONENT16, GPU.DEPTH_COMPONENT32F):  # profundidade
+        # Verifica se leitura é em um local válido
+        GPU._check_coords(coords, buffer.shape, "leitura")
 
-                #  Verifica se o Framebuffer do canal de profundidade foi alocado
-                if GPU.frame_buffer[GPU.draw_framebuffer].depth.size != 0:
+        # Retorna valor dos dados do Framebuffer
+        return buffer[coords[:, 1], coords[:, 0]]
 
-                    # Coleta a dimensão do Framebuffer para o canal de profundidade
-                    fb_dim = GPU.frame_buffer[GPU.draw_framebuffer].depth.shape
+    @staticmethod
+    def draw_pixel(coord, mode, data):
+        """Define o valor do pixel no framebuffer."""
+        if coord and np.any(data):
+            buffer = GPU._attachment(GPU.draw_framebuffer, mode)
 
-                    # Verifica se escrita é em um local válido
-                    if coord[0] < 0 or coord[0] >= fb_dim[1] or coord[1] < 0 or coord[1] >= fb_dim[0]:
-                        raise Exception(f"Acesso irregular de escrita na posição [{coord[0]}, {coord[1]}] do Framebuffer {fb_dim[1], fb_dim[0]}")
+            # Coleta a dimensão do Framebuffer
+            fb_dim = buffer.shape
 
-                    # Verifica se os dados estão no tamanho certo e em um formato suportado
-                    if isinstance(data, (list, tuple, np.ndarray)) and (len(data)==1) and isinstance(data[0], (int, float)):
-                        # Grava dados no Framebuffer
-                        GPU.frame_buffer[GPU.draw_framebuffer].depth[coord[1]][coord[0]] = data
-                    else:
-                        raise Exception(f"Valores do Frame buffer devem ser um vetor com um único valor numérico: {data}")
-                    
-                else:
-                    raise Exception(f"Frame buffer {GPU.draw_framebuffer} não alocado para o canal de profundidade")
+            # Verifica se escrita é em um local válido
+            if coord[0] < 0 or coord[0] >= fb_dim[1] or coord[1] < 0 or coord[1] >= fb_dim[0]:
+                raise Exception(f"Acesso irregular de escrita na posição [{coord[0]}, {coord[1]}] do Framebuffer {fb_dim[1], fb_dim[0]}")
 
-            else:
-                raise Exception(f"Modo inválido de leitura do Frame buffer ({mode})")
+            if mode in (GPU.RGB8, GPU.RGBA8):  # cores
+                # Verifica se os dados estão no tamanho certo e em uma faixa suportada
+                if not (isinstance(data, (list, tuple, np.ndarray)) and (len(data) == (mode+2)) and all( 0 <= i <= 255 for i in data)):
+                    raise Exception(f"Valores do Frame buffer devem estar em um vetor de dimensão [{mode+2}] ser inteiros e estar entre 0 e 255")
+            else:  # profundidade
+                # Verifica se os dados estão no tamanho certo e em um formato suportado
+                if not (isinstance(data, (list, tuple, np.ndarray)) and (len(data)==1) and isinstance(data[0], (int, float))):
+                    raise Exception(f"Valores do Frame buffer devem ser um vetor com um único valor numérico: {data}")
 
+            # Grava dados no Framebuffer
+            buffer[coord[1]][coord[0]] = data
 
     @staticmethod
     def read_pixel(coord, mode):
         """Retorna o valor do pixel no framebuffer."""
         if coord:
-            if mode in (GPU.RGB8, GPU.RGBA8):  # cores
-
-                #  Verifica se o Framebuffer do canal de cor foi alocado
-                if GPU.frame_buffer[GPU.draw_framebuffer].color.size != 0:
-                    
-                    # Coleta a dimensão do Framebuffer para o canal de cor
-                    fb_dim = GPU.frame_buffer[GPU.read_framebuffer].color.shape
+            buffer = GPU._attachment(GPU.read_framebuffer, mode)
 
-                    # Verifica se leitura é em um local válido
-                    if coord[0] < 0 or coord[0] >= fb_dim[1] or coord[1] < 0 or coord[1] >= fb_dim[0]:
-                        raise Exception(f"Acesso irregular de leitura na posição [{coord[0]}, {coord[1]}] do Framebuffer {fb_dim[1], fb_dim[0]}")
+            # Coleta a dimensão do Framebuffer
+            fb_dim = buffer.shape
 
-                    data = GPU.frame_buffer[GPU.read_framebuffer].color[coord[1]][coord[0]]
+            # Verifica se leitura é em um local válido
+            if coord[0] < 0 or coord[0] >= fb_dim[1] or coord[1] < 0 or coord[1] >= fb_dim[0]:
+                raise Exception(f"Acesso irregular de leitura na posição [{coord[0]}, {coord[1]}] do Framebuffer {fb_dim[1], fb_dim[0]}")
 
-                else:
-                    raise Exception(f"Frame buffer {GPU.draw_framebuffer} não alocado para o canal de cor")
-
-            elif mode in (GPU.DEPTH_COMPONENT16, GPU.DEPTH_COMPONENT32F):  # profundidade
-
-                #  Verifica se o Framebuffer do canal de profundidade foi alocado
-                if GPU.frame_buffer[GPU.draw_framebuffer].depth.size != 0:
+            # Retorna valor dos dados do Framebuffer
+            return buffer[coord[1]][coord[0]]
 
-                    # Coleta a dimensão do Framebuffer para o canal de profundidade
-                    fb_dim = GPU.frame_buffer[GPU.read_framebuffer].depth.shape
+    @staticmethod
+    def blit_framebuffer(filter_mode=BOX_FILTER, region=None):
+        """Copia as cores do FrameBuffer de leitura para o de escrita reduzindo a resolução."""
+        # O FrameBuffer de leitura deve ter uma resolução múltipla inteira do de escrita
+        # (por exemplo no super sampling), cada fator pode ser diferente na horizontal e na
+        # vertical. Toda a redução é feita com operações sobre os vetores de uma só vez.
+        # Com region (x0, y0, x1, y1), em pixels do FrameBuffer de escrita, só essa região
+        # é atualizada.
+        source = GPU._attachment(GPU.read_framebuffer, GPU.RGB8)
+        target = GPU._attachment(GPU.draw_framebuffer, GPU.RGB8)
+
+        height, width, channels = target.shape
+        if source.shape[0] % height or source.shape[1] % width or source.shape[2] != channels:
+            raise Exception(f"Frame buffer {source.shape[1], source.shape[0]} não é múltiplo de {width, height}")
+        scale_y, scale_x = source.shape[0] // height, source.shape[1] // width
+
+        if region is not None:
+            x0, y0 = max(region[0], 0), max(region[1], 0)
+            x1, y1 = min(region[2], width), min(region[3], height)
+            if x1 <= x0 or y1 <= y0:
+                return
+            # O filtro tenda usa os pixels vizinhos, então a redução é feita com uma borda de
+            # um pixel que depois é descartada
+            px0, py0 = max(x0 - 1, 0), max(y0 - 1, 0)
+            px1, py1 = min(x1 + 1, width), min(y1 + 1, height)
+            source = source[py0*scale_y:py1*scale_y, px0*scale_x:px1*scale_x]
+            resolved = GPU._resolve(source, py1 - py0, px1 - px0, scale_y, scale_x, filter_mode)
+            target[y0:y1, x0:x1] = resolved[y0-py0:y1-py0, x0-px0:x1-px0]
+            return
+
+        target[:] = GPU._resolve(source, height, width, scale_y, scale_x, filter_mode)
 
-                    # Verifica se leitura é em um local válido                    
-                    if coord[0] < 0 or coord[0] >= fb_dim[1] or coord[1] < 0 or coord[1] >= fb_dim[0]:
-                        raise Exception(f"Acesso irregular de leitura na posição [{coord[0]}, {coord[1]}] do Framebuffer {fb_dim[1], fb_dim[0]}")
+    @staticmethod
+    def _resolve(source, height, width, scale_y, scale_x, filter_mode):
+        """Reduz as amostras de source para height x width pixels com o filtro informado."""
+        channels = source.shape[2]
+
+        # Blocos de amostras de cada pixel: (altura, amostras em y, largura, amostras em x, canais)
+        samples = source.reshape(height, scale_y, width, scale_x, channels).astype(np.float64)
+
+        if filter_mode == GPU.TENT_FILTER:
+            samples = GPU._tent(samples, 0, scale_y)
+            resolved = GPU._tent(samples, 2, scale_x)
+            # Arredonda para não escurecer a imagem com os erros de ponto flutuante dos pesos
+            resolved = np.rint(resolved.reshape(height, width, channels))
+        else:
+            resolved = samples.mean(axis=(1, 3))
 
-                    data = GPU.frame_buffer[GPU.read_framebuffer].depth[coord[1]][coord[0]]
+        return np.clip(resolved, 0, 255)
 
-                else:
-                    raise Exception(f"Frame buffer {GPU.draw_framebuffer} não alocado para o canal de profundidade")
+    @staticmethod
+    def _tent(samples, axis, scale):
+        """Reduz um eixo de blocos de amostras com pesos triangulares (filtro tenda)."""
+        # O filtro tem raio de um pixel: usa todas as amostras do próprio pixel e a metade
+        # mais próxima das amostras dos pixels vizinhos (repetindo as bordas da imagem).
+        centers = (np.arange(scale) + 0.5) / scale - 0.5  # posição das amostras no pixel
+        weights = np.clip(1 - np.abs(np.stack((centers - 1, centers, centers + 1))), 0, None)
+
+        count = samples.shape[axis]
+        previous = np.concatenate((samples.take([0], axis), samples.take(range(count-1), axis)), axis)
+        following = np.concatenate((samples.take(range(1, count), axis), samples.take([count-1], axis)), axis)
+
+        # Soma ponderada no eixo das amostras (logo após o eixo dos pixels)
+        total = sum(np.tensordot(np.moveaxis(blocks, axis+1, -1), weight, axes=1)
+                    for blocks, weight in zip((previous, samples, following), weights))
+        return np.expand_dims(total / weights.sum(), axis+1)
 
+    @staticmethod
+    def save_image(filename=None):
+        """Método para salvar a imagem do framebuffer em um arquivo."""
+        # A imagem é copiada e gravada em segundo plano, então o FrameBuffer pode ser usado
+        # em seguida. Sem filename é usado o próximo número livre do arquivo de imagem (ou o
+        # próprio arquivo nos formatos animados, em que cada imagem é um quadro).
+        if not filename:
+            if gravador.Gravador.formato(GPU.image_file) in gravador.ANIMADOS:
+                filename = GPU.image_file
             else:
-                raise Exception(f"Modo inválido de leitura do Frame buffer ({mode})")
+                filename = GPU.writer.sequence(GPU.image_file)
+        GPU.writer.write(GPU.frame_buffer[GPU.read_framebuffer].color, filename)
 
-            # Retorna valor dos dados do Framebuffer
-            return data
+    @staticmethod
+    def flush_images():
+        """Espera as imagens pendentes serem gravadas."""
+        if GPU.writer:
+            GPU.writer.flush()
 
     @staticmethod
-    def save_image():
-        """Método para salvar a imagem do framebuffer em um arquivo."""
-        if GPU.frame_buffer[GPU.read_framebuffer].color.shape[2] == 3:
-            img = Image.fromarray(GPU.frame_buffer[GPU.read_framebuffer].color, 'RGB')
-        else:
-            img = Image.fromarray(GPU.frame_buffer[GPU.read_framebuffer].color, 'RGBA')
-        counter = 0
-        filename = GPU.image_file.split('.')
-        while os.path.exists(filename[0]+str(counter).zfill(3)+'.'+filename[1]):
-            counter += 1
-        img.save(filename[0]+str(counter).zfill(3)+'.'+filename[1])
+    def close_writer():
+        """Grava as imagens pendentes e encerra a gravação em segundo plano."""
+        if GPU.writer:
+            GPU.writer.close()
+
+    @staticmethod
+    def texture_key(textura):
+        """Identifica a textura pelo caminho do arquivo e pela data de modificação."""
+        file = os.path.abspath(os.path.join(GPU.path, textura))
+        return file, os.path.getmtime(file)
 
     @staticmethod
     def load_texture(textura):
         """Método para ler textura."""
-        file = os.path.join(GPU.path, textura)
-        imagem = Image.open(file)
-        matriz = np.array(imagem)
-        return matriz
+        # A matriz retornada é compartilhada pelo cache e não pode ser alterada
+        return GPU.load_mipmaps(textura)[0]
+
+    @staticmethod
+    def load_mipmaps(textura):
+        """Retorna os níveis do mipmap da textura, o primeiro sendo a própria imagem."""
+        key = GPU.texture_key(textura)
+        levels = GPU.textures.pop(key, None)
+        if levels is None:
+            levels = GPU._decode_texture(*key)
+            for level in levels:
+                level.flags.writeable = False
+            GPU.textures_bytes += sum(level.nbytes for level in levels)
+        GPU.textures[key] = levels  # reinserida como a mais recente
+
+        # A textura atual fica no cache mesmo que sozinha ultrapasse o limite
+        while GPU.textures_bytes > GPU.TEXTURE_CACHE_BYTES and len(GPU.textures) > 1:
+            _, evicted = GPU.textures.popitem(last=False)
+            GPU.textures_bytes -= sum(level.nbytes for level in evicted)
+        return levels
+
+    @staticmethod
+    def mipmap_shapes(height, width):
+        """Dimensões de cada nível do mipmap, do nível 0 (a imagem) até 1x1 texel."""
+        shapes = [(height, width, 3)]
+        while max(height, width) > 1:
+            height, width = (height + 1) // 2, (width + 1) // 2
+            shapes.append((height, width, 3))
+        return shapes
+
+    @staticmethod
+    def generate_mipmaps(image):
+        """Gera os níveis do mipmap após o nível 0 em um único vetor de 8bits por canal."""
+        # Cada nível é a média de blocos de 2x2 texels do anterior (calculada em float e
+        # arredondada só ao guardar); dimensões ímpares repetem a última linha ou coluna
+        level = np.asarray(image, dtype=np.float32)
+        levels = [np.empty(0, dtype=np.float32)]
+        for height, width, _ in GPU.mipmap_shapes(*level.shape[:2])[1:]:
+            level = np.pad(level, ((0, height*2 - level.shape[0]), (0, width*2 - level.shape[1]), (0, 0)),
+                           mode='edge')
+            level = level.reshape(height, 2, width, 2, 3).mean(axis=(1, 3))
+            levels.append(level.ravel())
+        return np.round(np.concatenate(levels)).astype(np.uint8)
+
+    @staticmethod
+    def _split_mipmaps(image, pyramid):
+        """Separa o vetor gerado por generate_mipmaps nos níveis (sem copiar os dados)."""
+        levels, offset = [image], 0
+        for shape in GPU.mipmap_shapes(*image.shape[:2])[1:]:
+            size = int(np.prod(shape))
+            levels.append(pyramid[offset:offset + size].reshape(shape))
+            offset += size
+        return levels
+
+    @staticmethod
+    def _decode_texture(file, mtime):
+        """Decodifica a imagem e gera o mipmap, ou lê os dois já prontos do cache em disco."""
+        # Qualquer formato de imagem (paleta, tons de cinza, com transparência, ...) é
+        # convertido para RGB, assim as texturas sempre têm 3 canais de 8bits
+        if not GPU.TEXTURE_CACHE_DIR:
+            image = np.array(Image.open(file).convert("RGB"))
+            return GPU._split_mipmaps(image, GPU.generate_mipmaps(image))
+
+        name = hashlib.sha1("{0}:{1!r}:RGB".format(file, mtime).encode()).hexdigest()
+        cached = os.path.join(GPU.TEXTURE_CACHE_DIR, name + ".npy")
+        cached_mipmaps = os.path.join(GPU.TEXTURE_CACHE_DIR, name + ".mip.npy")
+        if not (os.path.exists(cached) and os.path.exists(cached_mipmaps)):
+            # Gravados com outro nome e renomeados, assim outro processo nunca lê um arquivo
+            # incompleto (se dois processos gravarem a mesma textura, fica a última)
+            os.makedirs(GPU.TEXTURE_CACHE_DIR, exist_ok=True)
+            image = np.array(Image.open(file).convert("RGB"))
+            for path, data in ((cached_mipmaps, GPU.generate_mipmaps(image)), (cached, image)):
+                with tempfile.NamedTemporaryFile(dir=GPU.TEXTURE_CACHE_DIR, suffix=".npy",
+                                                 delete=False) as temporary:
+                    np.save(temporary, data)
+                os.replace(temporary.name, path)
+        return GPU._split_mipmaps(np.load(cached, mmap_mode="r"), np.load(cached_mipmaps, mmap_mode="r"))
 
     @staticmethod
     def get_frame_buffer():
@@ -250,3 +569,10 @@ class GPU:
     @staticmethod
     def swap_buffers():
         """Método para a troca dos buffers (NÃO IMPLEMENTADA)."""
+
+
+# Garante que memórias compartilhadas não fiquem alocadas após o fim do programa
+atexit.register(GPU.release_shared)
+
+# Garante que as imagens na fila sejam gravadas antes do fim do programa
+atexit.register(GPU.close_writer)
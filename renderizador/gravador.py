@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Gravação das imagens em arquivos em segundo plano.
+
+Desenvolvido por: Edgard Ortiz Neto
+Disciplina: Computação Gráfica
+Data: 18 de outubro de 2026
+"""
+
+import io           # Para codificar os quadros em memória
+import os           # Para rotinas do sistema operacional
+import re           # Para reconhecer os arquivos já numerados
+import zlib         # Para o CRC dos blocos do APNG
+import queue        # Fila limitada de imagens a gravar
+import struct       # Para os blocos binários do APNG
+import threading    # Thread que grava as imagens
+
+import numpy as np  # Biblioteca do Numpy
+from PIL import Image  # Para codificar as imagens
+
+# Formatos conhecidos a partir da extensão do arquivo
+FORMATOS = {".png": "png", ".ppm": "ppm", ".npy": "npy", ".gif": "gif", ".apng": "apng"}
+
+# Formatos em que os quadros gravados no mesmo arquivo formam uma animação
+ANIMADOS = ("gif", "apng")
+
+
+class Gravador:
+    """Codifica e grava imagens em uma thread, sem bloquear a renderização.
+
+    As imagens ficam em uma fila limitada (queue_size); se a gravação não acompanhar a
+    renderização, write() espera haver espaço na fila. O formato é definido pela extensão
+    do arquivo: png (com nível de compressão compress_level), ppm e npy (sem compressão),
+    gif e apng (todos os quadros gravados no mesmo arquivo formam uma animação, codificada
+    à medida que os quadros chegam e concluída ao se chamar flush() ou close()); outras
+    extensões ficam a cargo do Pillow.
+    """
+
+    QUEUE_SIZE = 8       # imagens que podem aguardar a gravação
+    COMPRESS_LEVEL = 6   # compressão do PNG (0 a 9)
+
+    def __init__(self, queue_size=None, compress_level=None, fps=30):
+        """Cria a fila de imagens (a thread só é iniciada na primeira imagem)."""
+        self.queue = queue.Queue(maxsize=queue_size or Gravador.QUEUE_SIZE)
+        self.compress_level = Gravador.COMPRESS_LEVEL if compress_level is None else compress_level
+        self.fps = fps
+        self.thread = None
+        self.pid = os.getpid()  # processo dono da thread (processos criados por fork não a têm)
+        self.counters = {}      # próximo número de cada sequência de arquivos
+        self.animations = {}    # animações sendo gravadas (AnimacaoPNG ou AnimacaoGIF)
+        self.error = None       # erro da thread, repassado na próxima chamada
+
+    @staticmethod
+    def formato(filename):
+        """Formato de gravação a partir da extensão do arquivo."""
+        # Outras extensões (ex.: .jpg, .bmp) são gravadas com o formato escolhido pelo Pillow
+        return FORMATOS.get(os.path.splitext(filename)[1].lower(), "imagem")
+
+    def sequence(self, pattern):
+        """Retorna o próximo nome livre da sequência numerada (ex.: tela000.png, tela001.png)."""
+        # A pasta só é lida no início de cada sequência, depois os números são incrementados
+        name, extension = os.path.splitext(pattern)
+        if pattern not in self.counters:
+            path, prefix = os.path.split(name)
+            numbered = re.compile(re.escape(prefix) + r"(\d+)" + re.escape(extension) + "$")
+            found = [int(match.group(1)) for match in map(numbered.match, os.listdir(path or "."))
+                     if match]
+            self.counters[pattern] = max(found) + 1 if found else 0
+        counter = self.counters[pattern]
+        self.counters[pattern] += 1
+        return name + str(counter).zfill(3) + extension
+
+    def write(self, image, filename):
+        """Coloca uma cópia da imagem na fila de gravação."""
+        self.check()
+        if self.pid != os.getpid():  # processo criado por fork: a thread do pai não existe aqui
+            self.__init__(self.queue.maxsize, self.compress_level, self.fps)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.queue.put((np.array(image), filename))
+
+    def run(self):
+        """Laço da thread que grava as imagens da fila."""
+        while True:
+            image, filename = self.queue.get()
+            try:
+                if image is None:  # pedido para encerrar a thread
+                    return
+                self.save(image, filename)
+            except Exception as error:  # pylint: disable=broad-except
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def save(self, image, filename):
+        """Codifica e grava uma imagem (executado na thread)."""
+        formato = Gravador.formato(filename)
+        if formato == "npy":
+            np.save(filename, image)
+            return
+        img = Image.fromarray(image, "RGB" if image.shape[2] == 3 else "RGBA")
+        if formato in ANIMADOS:
+            if filename not in self.animations:
+                animation = AnimacaoPNG if formato == "apng" else AnimacaoGIF
+                self.animations[filename] = animation(filename, self.fps, self.compress_level)
+            self.animations[filename].add(img)
+        elif formato == "png":
+            img.save(filename, "PNG", compress_level=self.compress_level)
+        elif formato == "ppm":
+            img.save(filename, "PPM")
+        else:
+            img.save(filename)
+
+    def flush(self):
+        """Espera todas as imagens da fila serem gravadas e conclui as animações."""
+        if self.thread is None or self.pid != os.getpid():
+            return
+        self.queue.join()
+        animations, self.animations = self.animations, {}
+        for animation in animations.values():
+            try:
+                animation.close()
+            except Exception as error:  # pylint: disable=broad-except
+                self.error = self.error or error
+        self.check()
+
+    def close(self):
+        """Grava o que estiver pendente e encerra a thread."""
+        if self.thread is None or self.pid != os.getpid():
+            return
+        self.flush()
+        self.queue.put((None, None))
+        self.thread.join()
+        self.thread = None
+
+    def check(self):
+        """Repassa um erro ocorrido na thread de gravação."""
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+class AnimacaoPNG:
+    """Grava um APNG bloco a bloco, sem manter os quadros em memória.
+
+    Cada quadro é codificado como PNG pelo Pillow e seus dados (IDAT) são copiados para o
+    arquivo como um novo quadro da animação. A quantidade de quadros, que fica no início
+    do arquivo (acTL), é corrigida em close().
+    """
+
+    def __init__(self, filename, fps, compress_level):
+        """Cria o arquivo da animação."""
+        self.file = open(filename, "wb")
+        self.delay = int(round(1000 / fps))  # duração de cada quadro em milissegundos
+        self.compress_level = compress_level
+        self.frames = 0
+        self.sequence = 0    # número de sequência dos blocos fcTL e fdAT
+        self.control = None  # posição do bloco acTL no arquivo
+
+    def chunk(self, kind, data):
+        """Grava um bloco do PNG (tamanho, tipo, dados e CRC)."""
+        self.file.write(struct.pack(">I", len(data)) + kind + data +
+                        struct.pack(">I", zlib.crc32(kind + data)))
+
+    def add(self, image):
+        """Codifica e grava um quadro."""
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG", compress_level=self.compress_level)
+        data = buffer.getvalue()
+        chunks, position = [], 8  # os blocos seguem a assinatura de 8 bytes
+        while position < len(data):
+            length, kind = struct.unpack(">I4s", data[position:position + 8])
+            chunks.append((kind, data[position + 8:position + 8 + length]))
+            position += length + 12
+        header = dict(chunks)[b"IHDR"]
+
+        if self.control is None:  # o primeiro quadro define o cabeçalho da imagem
+            self.file.write(data[:8])
+            self.chunk(b"IHDR", header)
+            self.control = self.file.tell()
+            self.chunk(b"acTL", struct.pack(">II", 0, 0))
+        width, height = struct.unpack(">II", header[:8])
+        self.chunk(b"fcTL", struct.pack(">IIIIIHHBB", self.sequence, width, height, 0, 0,
+                                        self.delay, 1000, 0, 0))
+        self.sequence += 1
+        for kind, content in chunks:
+            if kind != b"IDAT":
+                continue
+            if self.frames == 0:  # o primeiro quadro também é a imagem vista sem animação
+                self.chunk(b"IDAT", content)
+            else:
+                self.chunk(b"fdAT", struct.pack(">I", self.sequence) + content)
+                self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        """Conclui o arquivo com a quantidade de quadros (repetição infinita)."""
+        try:
+            if self.control is not None:
+                self.chunk(b"IEND", b"")
+                self.file.seek(self.control)
+                self.chunk(b"acTL", struct.pack(">II", self.frames, 0))
+        finally:
+            self.file.close()
+
+
+class AnimacaoGIF:
+    """Grava um GIF animado com o Pillow recebendo os quadros à medida que chegam.
+
+    O Pillow codifica a animação em uma thread própria, consumindo os quadros de uma fila
+    pequena. Ele guarda de cada quadro só a região alterada, já reduzida à paleta.
+    """
+
+    QUEUE_SIZE = 2  # quadros que podem aguardar a codificação
+
+    def __init__(self, filename, fps, _compress_level=None):
+        """Prepara a fila de quadros (a thread só é iniciada no primeiro quadro)."""
+        self.filename = filename
+        self.delay = int(round(1000 / fps))  # duração de cada quadro em milissegundos
+        self.queue = queue.Queue(maxsize=AnimacaoGIF.QUEUE_SIZE)
+        self.thread = None
+        self.error = None
+        self.finished = False  # o fim da animação já foi recebido
+
+    def add(self, image):
+        """Entrega um quadro para a codificação."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, args=(image,), daemon=True)
+            self.thread.start()
+        else:
+            self.queue.put(image)
+
+    def frames(self):
+        """Quadros seguintes ao primeiro, até o fim da animação (None)."""
+        while True:
+            image = self.queue.get()
+            if image is None:
+                self.finished = True
+                return
+            yield image
+
+    def run(self, first):
+        """Codifica a animação (executado na thread)."""
+        try:
+            first.save(self.filename, "GIF", save_all=True, append_images=self.frames(),
+                       duration=self.delay, loop=0)
+        except Exception as error:  # pylint: disable=broad-except
+            self.error = error
+            if not self.finished:  # descarta os quadros restantes sem bloquear quem os envia
+                for _ in self.frames():
+                    pass
+
+    def close(self):
+        """Espera a animação ser gravada."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Renderização em lote de várias cenas e quadros em um único processo.
+
+Desenvolvido por: Edgard Ortiz Neto
+Disciplina: Computação Gráfica
+Data: 18 de outubro de 2026
+"""
+
+import os               # Para rotinas do sistema operacional
+import json             # Para ler o manifesto
+import multiprocessing  # Para distribuir os trabalhos entre processos
+
+import gl               # Recupera rotinas de suporte ao X3D
+import gpu              # Simula os recursos de uma GPU
+import x3d              # Faz a leitura do arquivo X3D, gera o grafo de cena e faz traversal
+import gravador         # Grava as imagens em segundo plano
+
+
+class Lote:
+    """Renderiza os trabalhos de um manifesto reaproveitando o processo e os FrameBuffers.
+
+    O manifesto é um arquivo JSON com uma lista de trabalhos (ou um objeto com essa lista
+    em "jobs"), cada um com os campos:
+
+    input : arquivo X3D da cena
+    output : arquivo da imagem (padrão: nome da cena com extensão .png); com vários quadros
+        pode ter um campo de formatação para o número do quadro, e.g. "onda_{0:03d}.png"
+    width, height : resolução da imagem (padrão: a do renderizador)
+    frames : quantidade de quadros (padrão: 1)
+    fps : quadros por segundo da animação (padrão: 30)
+    time : instante do primeiro quadro em segundos (padrão: 0)
+    first : número do primeiro quadro nos nomes dos arquivos (padrão: 0)
+
+    Caminhos relativos são em relação à pasta do manifesto.
+    """
+
+    atual = None  # Lote de cada processo quando os trabalhos são distribuídos
+
+    # Na animação cada processo recebe alguns trechos para equilibrar quadros de custo desigual
+    TRECHOS_POR_PROCESSO = 4
+
+    def __init__(self, renderizador):
+        """Prepara a GPU e o renderizador que serão usados por todos os trabalhos."""
+        # Os processos do lote já são a forma de paralelismo, então cada cena é renderizada
+        # em um único processo (sem FrameBuffers compartilhados)
+        renderizador.jobs = 1
+        self.renderizador = renderizador
+        gpu.GPU(renderizador.image_file, ".")
+        renderizador.framebuffers = {}  # a GPU recomeçou, então os FrameBuffers são refeitos
+        renderizador.allocated = None
+        renderizador.mapping()
+
+    @staticmethod
+    def load(manifest, width, height):
+        """Lê o manifesto retornando os trabalhos com todos os campos preenchidos."""
+        with open(manifest, encoding="utf-8") as arquivo:
+            jobs = json.load(arquivo)
+        if isinstance(jobs, dict):
+            jobs = jobs["jobs"]
+
+        path = os.path.dirname(os.path.abspath(manifest))
+        loaded = []
+        for job in jobs:
+            if "input" not in job:
+                raise Exception("Trabalho do manifesto sem o campo input: {0}".format(job))
+            x3d_file = os.path.join(path, job["input"])
+            output = job.get("output", os.path.splitext(os.path.basename(x3d_file))[0] + ".png")
+            loaded.append({
+                "input": x3d_file,
+                "output": os.path.join(path, output),
+                "width": int(job.get("width", width)),
+                "height": int(job.get("height", height)),
+                "frames": int(job.get("frames", 1)),
+                "fps": float(job.get("fps", 30)),
+                "time": float(job.get("time", 0)),
+                "first": int(job.get("first", 0)),
+            })
+        return loaded
+
+    @staticmethod
+    def output(job, frame):
+        """Nome do arquivo de um quadro do trabalho."""
+        frame += job["first"]
+        if gravador.Gravador.formato(job["output"]) in gravador.ANIMADOS:
+            return job["output"]  # todos os quadros no mesmo arquivo
+        if "{" in job["output"]:
+            return job["output"].format(frame)
+        if job["frames"] == 1 and job["first"] == 0:
+            return job["output"]
+        name, extension = os.path.splitext(job["output"])
+        return "{0}{1}{2}".format(name, str(frame).zfill(3), extension)
+
+    def render(self, job):
+        """Renderiza todos os quadros de um trabalho retornando os arquivos gerados."""
+        render = self.renderizador
+        buffers = len(gpu.GPU.buffers)  # buffers das geometrias a liberar no fim da cena
+
+        # Cada cena tem seus próprios nós nomeados e arquivos de textura
+        x3d.X3DNode.named_nodes = {}
+        gpu.GPU.path = os.path.dirname(job["input"])
+
+        render.x3d_file = job["input"]
+        render.width = job["width"]
+        render.height = job["height"]
+        render.scene = x3d.X3D(job["input"])
+        render.scene.parse()
+        render.setup()  # só realoca os FrameBuffers se a resolução mudou
+        render.setup_gl()
+
+        outputs = []
+        gpu.GPU.writer.fps = job["fps"]  # velocidade dos formatos animados (gif e apng)
+        for frame in range(job["frames"]):
+            # O relógio é definido pelo número do quadro, tornando o resultado reproduzível
+            gl.GL.frame_time = job["time"] + frame / job["fps"]
+            render.scene.update()
+            render.render()
+            outputs.append(Lote.output(job, frame))
+            os.makedirs(os.path.dirname(outputs[-1]), exist_ok=True)
+            gpu.GPU.save_image(outputs[-1])
+
+        gpu.GPU.flush_images()  # as imagens são gravadas em segundo plano
+        gpu.GPU.delete_buffers(range(buffers, len(gpu.GPU.buffers)))
+        return list(dict.fromkeys(outputs))  # nos formatos animados é um só arquivo
+
+    @staticmethod
+    def run(manifest, renderizador, workers=1):
+        """Renderiza todos os trabalhos do manifesto, opcionalmente em vários processos."""
+        return Lote.execute(Lote.load(manifest, renderizador.width, renderizador.height),
+                            renderizador, workers)
+
+    @staticmethod
+    def animation(x3d_file, output, renderizador, duration, fps=30, start=0, workers=1):
+        """Renderiza uma sequência numerada de quadros de duration segundos da cena."""
+        # Com o relógio definido pelo número do quadro os quadros são independentes, então a
+        # sequência é dividida em trechos que os processos renderizam ao mesmo tempo. Cada
+        # processo lê a cena uma vez por trecho recebido.
+        frames = max(1, int(round(duration * fps)))
+        if gravador.Gravador.formato(output) in gravador.ANIMADOS:
+            # Todos os quadros vão para um único arquivo, gravado por um só processo
+            workers = 1
+        elif "{" not in output:
+            name, extension = os.path.splitext(output)
+            output = name + "{0:0" + str(max(3, len(str(frames - 1)))) + "d}" + extension
+        size = frames if workers <= 1 else max(1, -(-frames // (workers * Lote.TRECHOS_POR_PROCESSO)))
+        jobs = [{"input": os.path.abspath(x3d_file),
+                 "output": os.path.abspath(output),
+                 "width": renderizador.width,
+                 "height": renderizador.height,
+                 "frames": min(size, frames - first),
+                 "fps": fps,
+                 "time": start + first / fps,
+                 "first": first}
+                for first in range(0, frames, size)]
+        return Lote.execute(jobs, renderizador, workers)
+
+    @staticmethod
+    def execute(jobs, renderizador, workers=1):
+        """Renderiza os trabalhos informados, opcionalmente em vários processos."""
+        if workers > 1:
+            if "fork" not in multiprocessing.get_all_start_methods():
+                raise Exception("Renderização em lote paralela requer suporte a fork do sistema operacional")
+            # Cada processo cria seu próprio renderizador uma única vez (com a configuração
+            # herdada no fork) e o reaproveita para todos os trabalhos que receber
+            with multiprocessing.get_context("fork").Pool(workers, initializer=start_worker,
+                                                          initargs=(type(renderizador), renderizador.backend)) as pool:
+                results = pool.map(render_job, jobs, chunksize=1)
+        else:
+            lote = Lote(renderizador)
+            results = [lote.render(job) for job in jobs]
+
+        for job, outputs in zip(jobs, results):
+            print("{0} -> {1}".format(job["input"], ", ".join(outputs)))
+        return results
+
+
+def start_worker(renderizador_class, backend):
+    """Cria o renderizador de um processo do lote."""
+    renderizador = renderizador_class()
+    renderizador.backend = backend
+    Lote.atual = Lote(renderizador)
+
+
+def render_job(job):
+    """Renderiza um trabalho no processo atual do lote."""
+    return Lote.atual.render(job)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Renderização paralela por faixas da tela (sort-first).
+
+Desenvolvido por: Edgard Ortiz Neto
+Disciplina: Computação Gráfica
+Data: 18 de outubro de 2026
+"""
+
+import time             # Para operações com tempo
+import multiprocessing  # Para os processos que renderizam as faixas
+
+import numpy as np      # Biblioteca do Numpy
+
+import gl               # Recupera rotinas de suporte ao X3D
+import gpu              # Simula os recursos de uma GPU
+
+
+class Paralelo:
+    """Distribui a rasterização de cada quadro entre vários processos."""
+
+    # Cena a ser percorrida pelos processos, herdada por eles no momento do fork
+    scene = None
+
+    # Cada processo recebe algumas faixas para equilibrar cenas com conteúdo desigual
+    FAIXAS_POR_PROCESSO = 4
+
+    def __init__(self, scene, workers):
+        """Cria os processos e divide a tela em faixas horizontais."""
+        # Os FrameBuffers devem ter sido alocados com memória compartilhada e o GL
+        # configurado antes, pois os processos herdam esse estado ao serem criados.
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise Exception("Renderização paralela requer suporte a fork do sistema operacional")
+
+        Paralelo.scene = scene
+        self.workers = workers
+
+        # Divide a tela em faixas horizontais de alturas próximas
+        count = max(1, min(gl.GL.height, workers * Paralelo.FAIXAS_POR_PROCESSO))
+        limits = np.linspace(0, gl.GL.height, count + 1).astype(int)
+        self.bands = [(0, int(y0), gl.GL.width, int(y1))
+                      for y0, y1 in zip(limits[:-1], limits[1:]) if y1 > y0]
+
+        self.pool = multiprocessing.get_context("fork").Pool(workers)
+
+    def render(self):
+        """Renderiza o quadro atual dividido entre os processos."""
+        # Todos os processos usam o mesmo instante e os mesmos FrameBuffers do quadro
+        frame_time = time.time()
+        framebuffers = (gpu.GPU.draw_framebuffer, gpu.GPU.read_framebuffer)
+        jobs = [(band, frame_time, framebuffers) for band in self.bands]
+        counters = self.pool.map(render_band, jobs, chunksize=1)
+
+        # Estatísticas dos processos somadas às do processo principal
+        gl.GL.triangles += sum(triangles for triangles, _ in counters)
+        gl.GL.culled += sum(culled for _, culled in counters)
+
+    def close(self):
+        """Encerra os processos."""
+        self.pool.terminate()
+        self.pool.join()
+
+
+def render_band(job):
+    """Renderiza a cena somente na faixa informada (executado nos processos)."""
+    # Retorna os triângulos e formas descartadas contados na faixa
+    band, frame_time, (draw_framebuffer, read_framebuffer) = job
+    gpu.GPU.bind_framebuffer(gpu.GPU.DRAW_FRAMEBUFFER, draw_framebuffer)
+    gpu.GPU.bind_framebuffer(gpu.GPU.READ_FRAMEBUFFER, read_framebuffer)
+    gl.GL.scissor = band
+    gl.GL.frame_time = frame_time
+    triangles, culled = gl.GL.triangles, gl.GL.culled
+    # Cada processo pode ter feito por último uma faixa de outro quadro, então os eventos
+    # (relógios, interpoladores e ROUTEs) são levados ao instante do quadro antes de desenhar
+    Paralelo.scene.update()
+    Paralelo.scene.render()
+    gl.GL.deferredLighting()  # cada processo ilumina o G-buffer da sua faixa
+    return gl.GL.triangles - triangles, gl.GL.culled - culled
@@ -12,6 +12,8 @@ Data: 28 de Agosto de 2020
 import os           # Para rotinas do sistema operacional
 import argparse     # Para tratar os parâmetros da linha de comando
 
+import numpy as np  # Biblioteca do Numpy
+
 import gl           # Recupera rotinas de suporte ao X3D
 
 import interface    # Janela de visualização baseada no Matplotlib
@@ -19,6 +21,10 @@ import gpu          # Simula os recursos de uma GPU
 
 import x3d          # Faz a leitura do arquivo X3D, gera o grafo de cena e faz traversal
 import scenegraph   # Imprime o grafo de cena no console
+import paralelo     # Renderização paralela por faixas da tela
+import lote         # Renderização em lote de várias cenas
+import gravador     # Grava as imagens em segundo plano
+import backends     # Bibliotecas gráficas que podem desenhar a cena
 
 LARGURA = 60  # Valor padrão para largura da tela
 ALTURA = 40   # Valor padrão para altura da tela
@@ -30,6 +36,8 @@ class Renderizador:
     # Ajuste da escala, e.g. 2x2,4x4
     scale_x = scale_y = 2
     SSAA = True
+    SSAA_FILTER = gpu.GPU.BOX_FILTER  # filtro usado para reduzir o SSAA (BOX ou TENT)
+    INCREMENTAL = True  # na janela de visualização só redesenha as regiões que mudaram
 
     def __init__(self):
         """Definindo valores padrão."""
@@ -39,24 +47,63 @@ class Renderizador:
         self.image_file = "tela.png"
         self.scene = None
         self.framebuffers = {}
+        self.jobs = 1  # quantidade de processos para renderização paralela
+        self.paralelo = None
+        self.allocated = None  # configuração com que os FrameBuffers foram alocados
+        self.incremental = False  # redesenha somente as regiões da tela que mudaram
+        self.shapes = None  # assinatura e região de cada forma do quadro anterior
+        self.backend = "gl"  # backend com as rotinas de renderização (ver backends.py)
 
     def setup(self):
         """Configura o sistema para a renderização."""
         # Configurando color buffers para exibição na tela
 
-        # Cria 3 posições de FrameBuffer na GPU
-        fbo = gpu.GPU.gen_framebuffers(3)
+        # Cria 3 posições de FrameBuffer na GPU (reaproveitadas se o setup for refeito,
+        # por exemplo em uma mudança de resolução)
+        if not self.framebuffers:
+            fbo = gpu.GPU.gen_framebuffers(3)
+
+            # Define o atributo FRONT como o FrameBuffer principal
+            self.framebuffers["FRONT"] = fbo[0]
+
+            # Define o atributo DEPTH (profundidade) como o FrameBuffer secundário
+            self.framebuffers["DEPTH"] = fbo[1]
 
-        # Define o atributo FRONT como o FrameBuffer principal
-        self.framebuffers["FRONT"] = fbo[0]
+            # Define o atributo SSAA (Super sampling) como o FrameBuffer terciário
+            self.framebuffers["SSAA"] = fbo[2]
 
-        # Define o atributo DEPTH (profundidade) como o FrameBuffer secundário
-        self.framebuffers["DEPTH"] = fbo[1]
+        # Na renderização paralela os processos escrevem diretamente nos mesmos FrameBuffers
+        shared = self.jobs > 1
 
-        # Define o atributo SSAA (Super sampling) como o FrameBuffer terciário
-        self.framebuffers["SSAA"] = fbo[2]
+        # Resolução em que a cena é rasterizada (maior com o super sampling)
+        raster_width = self.width*Renderizador.scale_x if Renderizador.SSAA else self.width
+        raster_height = self.height*Renderizador.scale_y if Renderizador.SSAA else self.height
 
+        # Se a configuração não mudou (por exemplo várias cenas do mesmo tamanho renderizadas
+        # em sequência) as memórias já alocadas são reaproveitadas, bastando apagá-las
+        allocated = (self.width, self.height, Renderizador.scale_x, Renderizador.scale_y,
+                     Renderizador.SSAA, shared, gl.GL.SHADING == "deferred")
+        if allocated != self.allocated:
+            self.allocate(raster_width, raster_height, shared)
+            self.allocated = allocated
 
+        # Define cor que ira apagar o FrameBuffer quando clear_buffer() invocado
+        gpu.GPU.clear_color([0, 0, 0])
+
+        # Define a profundidade que ira apagar o FrameBuffer quando clear_buffer() invocado
+        # Assuma 1.0 o mais afastado e -1.0 o mais próximo da camera
+        gpu.GPU.clear_depth(1.0)
+
+        # Definindo tamanho do Viewport para renderização
+        self.scene.viewport(width=self.width, height=self.height)
+
+        # Apaga todos os FrameBuffers, inclusive o Z-buffer em toda a resolução do SSAA
+        self.clear()
+        self.shapes = None  # o próximo quadro é desenhado por inteiro
+        gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, self.framebuffers["FRONT"])
+
+    def allocate(self, raster_width, raster_height, shared):
+        """Aloca as memórias dos FrameBuffers."""
         # Define que a posição criada será usada para desenho e leitura
         # gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, self.framebuffers["FRONT"])
         # Opções:
@@ -72,7 +119,8 @@ class Renderizador:
             gpu.GPU.COLOR_ATTACHMENT,
             gpu.GPU.RGB8,
             self.width,
-            self.height
+            self.height,
+            shared=shared
         )
 
         #Descomente as seguintes linhas se for usar um Framebuffer para profundidade
@@ -80,29 +128,48 @@ class Renderizador:
             self.framebuffers["DEPTH"],
             gpu.GPU.DEPTH_ATTACHMENT,
             gpu.GPU.DEPTH_COMPONENT32F,
-            self.width if not Renderizador.SSAA else self.width*Renderizador.scale_x,
-            self.height if not Renderizador.SSAA else self.width*Renderizador.scale_y
+            raster_width,
+            raster_height,
+            shared=shared
         )
         gpu.GPU.framebuffer_storage(
             self.framebuffers["DEPTH"],
             gpu.GPU.COLOR_ATTACHMENT,
             gpu.GPU.RGB8,
-            self.width if not Renderizador.SSAA else self.width*Renderizador.scale_x,
-            self.height if not Renderizador.SSAA else self.width*Renderizador.scale_y
+            raster_width,
+            raster_height,
+            shared=shared
         )
 
+        # No shading deferred o FrameBuffer de profundidade também guarda o G-buffer: normais,
+        # cores difusas e materiais de cada pixel, iluminados depois de todas as formas
+        if gl.GL.SHADING == "deferred":
+            for attachment, mode in ((gpu.GPU.NORMAL_ATTACHMENT, gpu.GPU.NORMAL32F),
+                                     (gpu.GPU.ALBEDO_ATTACHMENT, gpu.GPU.ALBEDO32F),
+                                     (gpu.GPU.MATERIAL_ATTACHMENT, gpu.GPU.MATERIAL32I)):
+                gpu.GPU.framebuffer_storage(
+                    self.framebuffers["DEPTH"],
+                    attachment,
+                    mode,
+                    raster_width,
+                    raster_height,
+                    shared=shared
+                )
+
         # Memória de Framebuffer para canal de cores SSAA (Super sampling)
         gpu.GPU.framebuffer_storage(
             self.framebuffers["SSAA"],
             gpu.GPU.COLOR_ATTACHMENT,
             gpu.GPU.RGB8,
             self.width*Renderizador.scale_x,
-            self.height*Renderizador.scale_y
+            self.height*Renderizador.scale_y,
+            shared=shared
         )
     
         # Opções:
         # - COLOR_ATTACHMENT: alocações para as cores da imagem renderizada
         # - DEPTH_ATTACHMENT: alocações para as profundidades da imagem renderizada
+        # - NORMAL_ATTACHMENT, ALBEDO_ATTACHMENT e MATERIAL_ATTACHMENT: G-buffer do deferred
         # Obs: Você pode chamar duas vezes a rotina com cada tipo de buffer.
 
         # Tipos de dados:
@@ -110,49 +177,78 @@ class Renderizador:
         # - RGBA8: Para canais de cores (Vermelho, Verde, Azul, Transparência) 8bits cada (0-255)
         # - DEPTH_COMPONENT16: Para canal de Profundidade de 16bits (half-precision) (0-65535)
         # - DEPTH_COMPONENT32F: Para canal de Profundidade de 32bits (single-precision) (float)
+        # - NORMAL32F e ALBEDO32F: Para normais e cores difusas de 32bits (float) cada
+        # - MATERIAL32I: Para identificadores de materiais inteiros de 32bits
 
-        # Define que a posição criada será usada para desenho e leitura
-        gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, self.framebuffers["SSAA"]) if Renderizador.SSAA else gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, self.framebuffers["FRONT"])
-
-        # Define cor que ira apagar o FrameBuffer quando clear_buffer() invocado
-        gpu.GPU.clear_color([0, 0, 0])
-
-        # Define a profundidade que ira apagar o FrameBuffer quando clear_buffer() invocado
-        # Assuma 1.0 o mais afastado e -1.0 o mais próximo da camera
-        gpu.GPU.clear_depth(1.0)
-
-        # Definindo tamanho do Viewport para renderização
-        self.scene.viewport(width=self.width, height=self.height)
-
-        # Z buffer integration
-        gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, self.framebuffers["DEPTH"])
-        [gpu.GPU.draw_pixel([j,i], gpu.GPU.DEPTH_COMPONENT32F, [float("inf")]) for i in range(self.height) for j in range(self.width)]
-        gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, self.framebuffers["FRONT"])
+    def setup_gl(self):
+        """Configura a biblioteca gráfica para desenhar nos FrameBuffers alocados."""
+        if Renderizador.SSAA:
+            gl.GL.setup(
+                self.framebuffers.get("DEPTH"),
+                self.framebuffers.get("SSAA"),
+                self.width*Renderizador.scale_x,
+                self.height*Renderizador.scale_y,
+                near=0.01,
+                far=1000,
+                aspect=self.width/self.height
+            )
+        else:
+            gl.GL.setup(
+                self.framebuffers.get("DEPTH"),
+                self.framebuffers.get("FRONT"),
+                self.width,
+                self.height,
+                near=0.01,
+                far=1000,
+                aspect=self.width/self.height
+            )
 
-    def pre(self):
+    def clear(self, region=None):
+        """Apaga as cores e profundidades de todos os FrameBuffers."""
+        # Cada clear_buffer() preenche os attachments inteiros em uma única operação
+        if region is None:
+            for position in self.framebuffers.values():
+                gpu.GPU.bind_framebuffer(gpu.GPU.DRAW_FRAMEBUFFER, position)
+                gpu.GPU.clear_buffer()
+            return
+
+        # Somente uma região da resolução de rasterização: apaga o Z-buffer e o FrameBuffer
+        # em que se desenha (o FRONT é refeito na redução do SSAA)
+        draw = "SSAA" if Renderizador.SSAA else "FRONT"
+        for position in (self.framebuffers["DEPTH"], self.framebuffers[draw]):
+            gpu.GPU.bind_framebuffer(gpu.GPU.DRAW_FRAMEBUFFER, position)
+            gpu.GPU.clear_buffer(region)
+
+    def pre(self, region=None):
         """Rotinas pré renderização."""
         # Função invocada antes do processo de renderização iniciar.
 
-        # Limpa o frame buffers atual
-        gpu.GPU.clear_buffer()
+        # Limpa os frame buffers (cores e Z-buffer) a cada quadro
+        self.clear(region)
 
-        if Renderizador.SSAA: gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, self.framebuffers["SSAA"])
+        if Renderizador.SSAA:
+            gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, self.framebuffers["SSAA"])
+        else:
+            gpu.GPU.bind_framebuffer(gpu.GPU.FRAMEBUFFER, self.framebuffers["FRONT"])
 
         # Recursos que podem ser úteis:
         # Define o valor do pixel no framebuffer: draw_pixel(coord, mode, data)
         # Retorna o valor do pixel no framebuffer: read_pixel(coord, mode)
 
-    def pos(self):
+    def pos(self, region=None):
         """Rotinas pós renderização."""
         # Função invocada após o processo de renderização terminar.
         if Renderizador.SSAA:
+            # Reduz o FrameBuffer do SSAA para a resolução final em uma única operação
+            gpu.GPU.bind_framebuffer(gpu.GPU.READ_FRAMEBUFFER, self.framebuffers["SSAA"])
             gpu.GPU.bind_framebuffer(gpu.GPU.DRAW_FRAMEBUFFER, self.framebuffers["FRONT"])
-            scale_factor = 1.0 / min(Renderizador.scale_x,Renderizador.scale_y)**2
-            for rows in range(0, self.height * Renderizador.scale_y, Renderizador.scale_y):
-                for cols in range(0, self.width * Renderizador.scale_x, Renderizador.scale_x):
-                    colors = [] 
-                    [colors.append(gpu.GPU.read_pixel([j+cols, i+rows], gpu.GPU.RGB8) * scale_factor) for i in range(Renderizador.scale_y) for j in range(Renderizador.scale_x)]
-                    gpu.GPU.draw_pixel([cols // Renderizador.scale_x, rows // Renderizador.scale_y], gpu.GPU.RGB8, [sum(color) for color in zip(*colors)])
+            if region is not None:
+                # Pixels finais com alguma amostra redesenhada, mais um pixel em cada lado
+                # que o filtro tenda mistura com os vizinhos
+                scale_x, scale_y = Renderizador.scale_x, Renderizador.scale_y
+                region = (region[0] // scale_x - 1, region[1] // scale_y - 1,
+                          -(-region[2] // scale_x) + 1, -(-region[3] // scale_y) + 1)
+            gpu.GPU.blit_framebuffer(Renderizador.SSAA_FILTER, region)
 
             gpu.GPU.bind_framebuffer(gpu.GPU.READ_FRAMEBUFFER, self.framebuffers["FRONT"])
         # Método para a troca dos buffers (NÃO IMPLEMENTADO)
@@ -160,34 +256,81 @@ class Renderizador:
 
     def mapping(self):
         """Mapeamento de funções para as rotinas de renderização."""
-        # Rotinas encapsuladas na classe GL (Graphics Library)
-        x3d.X3D.renderer["Polypoint2D"] = gl.GL.polypoint2D
-        x3d.X3D.renderer["Polyline2D"] = gl.GL.polyline2D
-        x3d.X3D.renderer["TriangleSet2D"] = gl.GL.triangleSet2D
-        x3d.X3D.renderer["TriangleSet"] = gl.GL.triangleSet
-        x3d.X3D.renderer["Viewpoint"] = gl.GL.viewpoint
-        x3d.X3D.renderer["Transform_in"] = gl.GL.transform_in
-        x3d.X3D.renderer["Transform_out"] = gl.GL.transform_out
-        x3d.X3D.renderer["TriangleStripSet"] = gl.GL.triangleStripSet
-        x3d.X3D.renderer["IndexedTriangleStripSet"] = gl.GL.indexedTriangleStripSet
-        x3d.X3D.renderer["IndexedFaceSet"] = gl.GL.indexedFaceSet
-        x3d.X3D.renderer["Box"] = gl.GL.box
-        x3d.X3D.renderer["Sphere"] = gl.GL.sphere
-        x3d.X3D.renderer["NavigationInfo"] = gl.GL.navigationInfo
-        x3d.X3D.renderer["DirectionalLight"] = gl.GL.directionalLight
-        x3d.X3D.renderer["PointLight"] = gl.GL.pointLight
-        x3d.X3D.renderer["Fog"] = gl.GL.fog
-        x3d.X3D.renderer["TimeSensor"] = gl.GL.timeSensor
-        x3d.X3D.renderer["SplinePositionInterpolator"] = gl.GL.splinePositionInterpolator
-        x3d.X3D.renderer["OrientationInterpolator"] = gl.GL.orientationInterpolator
+        # As rotinas (e as que compilam as geometrias durante o parse) vêm do backend
+        # escolhido, por padrão o encapsulado na classe GL (Graphics Library)
+        backends.activate(self.backend, x3d.X3D.renderer, x3d.X3D.compiler)
 
     def render(self):
         """Laço principal de renderização."""
+        if self.incremental and not self.paralelo:
+            return self.render_incremental()
         self.pre()  # executa rotina pré renderização
-        self.scene.render()  # faz o traversal no grafo de cena
+        if self.paralelo:
+            self.paralelo.render()  # faz o traversal no grafo de cena em vários processos
+        else:
+            self.scene.render()  # faz o traversal no grafo de cena
+            gl.GL.deferredLighting()  # ilumina o G-buffer (somente no shading deferred)
         self.pos()  # executa rotina pós renderização
         return gpu.GPU.get_frame_buffer()
 
+    def render_incremental(self):
+        """Renderiza somente a região da tela que mudou desde o quadro anterior."""
+        # O grafo de cena é percorrido uma vez gravando os desenhos (os eventos da cena são
+        # tratados normalmente); depois só a região alterada é apagada e redesenhada.
+        gl.GL.commands = []
+        try:
+            self.scene.render()
+            commands = gl.GL.commands
+        finally:
+            gl.GL.commands = None
+
+        region = self.damage(commands)
+        if region is None:  # nada mudou, o FrameBuffer já tem a imagem do quadro
+            return gpu.GPU.get_frame_buffer()
+
+        self.pre(region)
+        scissor = gl.GL.scissor
+        gl.GL.scissor = region  # as formas fora da região são descartadas
+        try:
+            gl.GL.replay(commands)
+            gl.GL.deferredLighting()
+        finally:
+            gl.GL.scissor = scissor
+        self.pos(region)
+        return gpu.GPU.get_frame_buffer()
+
+    def damage(self, commands):
+        """Retorna a região (x0, y0, x1, y1) da tela alterada pelos desenhos gravados."""
+        # Cada forma é identificada pela malha e pela ordem em que aparece (a mesma malha pode
+        # ser desenhada mais de uma vez). A região alterada une as regiões antiga e nova das
+        # formas que mudaram, surgiram ou sumiram. Retorna None se nada mudou.
+        screen = (0, 0, gl.GL.width, gl.GL.height)
+        shapes = {}
+        tracked = True
+        for command in commands:
+            if command["key"] is None:  # desenho que não pode ser acompanhado
+                tracked = False
+                continue
+            occurrence = 0
+            while (command["key"], occurrence) in shapes:
+                occurrence += 1
+            shapes[(command["key"], occurrence)] = (command["signature"], command["region"])
+
+        previous, self.shapes = self.shapes, shapes
+        if previous is None or not tracked:
+            return screen
+
+        regions = []
+        for key in shapes.keys() | previous.keys():
+            old, new = previous.get(key), shapes.get(key)
+            if old != new:
+                regions += [shape[1] for shape in (old, new) if shape is not None and shape[1] is not None]
+        if not regions:
+            return None
+        regions = np.array(regions)
+        return (int(regions[:, 0].min()), int(regions[:, 1].min()),
+                int(regions[:, 2].max()), int(regions[:, 3].max()))
+
     def main(self):
         """Executa a renderização."""
         # Tratando entrada de parâmetro
@@ -199,6 +342,18 @@ class Renderizador:
         parser.add_argument("-g", "--graph", help="imprime o grafo de cena", action='store_true')
         parser.add_argument("-p", "--pause", help="começa simulação em pausa", action='store_true')
         parser.add_argument("-q", "--quiet", help="não exibe janela", action='store_true')
+        parser.add_argument("-j", "--jobs", help="processos para renderização paralela", type=int)
+        parser.add_argument("-s", "--ssaa", help="fator do super sampling, e.g. 2x2, 3x3, 4x2")
+        parser.add_argument("-f", "--filter", help="filtro do super sampling", choices=["box", "tent"])
+        parser.add_argument("-e", "--engine", help="motor de rasterização", choices=gl.GL.ENGINES)
+        parser.add_argument("--shading", help="modo de iluminação", choices=gl.GL.SHADINGS)
+        parser.add_argument("--backend", help="rotinas de renderização", choices=list(backends.BACKENDS))
+        parser.add_argument("-c", "--compress", help="nível de compressão do PNG (0 a 9)", type=int)
+        parser.add_argument("--texture-cache", help="pasta do cache em disco das texturas decodificadas")
+        parser.add_argument("-b", "--batch", help="manifesto JSON de cenas para renderizar em lote")
+        parser.add_argument("-a", "--animation", help="duração em segundos da animação a renderizar em quadros", type=float)
+        parser.add_argument("--fps", help="quadros por segundo da animação", type=float, default=30)
+        parser.add_argument("--start", help="instante inicial da animação em segundos", type=float, default=0)
         args = parser.parse_args() # parse the arguments
         if args.input:
             self.x3d_file = args.input
@@ -208,6 +363,34 @@ class Renderizador:
             self.width = args.width
         if args.height:
             self.height = args.height
+        if args.jobs:
+            self.jobs = args.jobs
+        if args.ssaa:
+            Renderizador.scale_x, Renderizador.scale_y = (int(v) for v in args.ssaa.lower().split("x"))
+            Renderizador.SSAA = (Renderizador.scale_x, Renderizador.scale_y) != (1, 1)
+        if args.compress is not None:
+            gravador.Gravador.COMPRESS_LEVEL = args.compress
+        if args.engine:
+            gl.GL.ENGINE = args.engine
+        if args.shading:
+            gl.GL.SHADING = args.shading
+        if args.backend:
+            self.backend = args.backend
+        if args.texture_cache:
+            gpu.GPU.TEXTURE_CACHE_DIR = args.texture_cache
+        if args.filter:
+            Renderizador.SSAA_FILTER = gpu.GPU.TENT_FILTER if args.filter == "tent" else gpu.GPU.BOX_FILTER
+
+        # No modo em lote todas as cenas do manifesto são renderizadas sem janela
+        if args.batch:
+            lote.Lote.run(args.batch, self, self.jobs)
+            return
+
+        # Na animação os quadros são renderizados sem janela em uma sequência de imagens
+        if args.animation:
+            lote.Lote.animation(self.x3d_file, self.image_file, self, args.animation,
+                                args.fps, args.start, self.jobs)
+            return
 
         path = os.path.dirname(os.path.abspath(self.x3d_file))
 
@@ -235,31 +418,24 @@ class Renderizador:
         self.setup()
 
         # Iniciando Biblioteca Gráfica
-        if Renderizador.SSAA:
-            gl.GL.setup(
-                self.framebuffers.get("DEPTH"),
-                self.framebuffers.get("SSAA"),
-                self.width*Renderizador.scale_x,
-                self.height*Renderizador.scale_y,
-                near=0.01,
-                far=1000
-            )
-        else:
-            gl.GL.setup(
-                self.framebuffers.get("DEPTH"),
-                self.framebuffers.get("SSAA"),
-                self.width,
-                self.height,
-                near=0.01,
-                far=1000
-            )
-
-        # Se no modo silencioso salvar imagem e não mostrar janela de visualização
-        if args.quiet:
-            gpu.GPU.save_image()  # Salva imagem em arquivo
-        else:
-            window.set_saver(gpu.GPU.save_image)  # pasa a função para salvar imagens
-            window.preview(args.pause, self.render)  # mostra visualização
+        self.setup_gl()
+
+        # Cria os processos da renderização paralela (herdam a cena e o GL já configurados)
+        if self.jobs > 1:
+            self.paralelo = paralelo.Paralelo(self.scene, self.jobs)
+
+        try:
+            # Se no modo silencioso salvar imagem e não mostrar janela de visualização
+            if args.quiet:
+                self.render()  # renderiza o quadro (nos processos da renderização paralela, se houver)
+                gpu.GPU.save_image()  # Salva imagem em arquivo
+            else:
+                self.incremental = Renderizador.INCREMENTAL
+                window.set_saver(gpu.GPU.save_image)  # pasa a função para salvar imagens
+                window.preview(args.pause, self.render)  # mostra visualização
+        finally:
+            if self.paralelo:
+                self.paralelo.close()
 
 if __name__ == '__main__':
     renderizador = Renderizador()
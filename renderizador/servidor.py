@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Servidor de renderização que mantém as cenas carregadas entre as requisições.
+
+Desenvolvido por: Edgard Ortiz Neto
+Disciplina: Computação Gráfica
+Data: 18 de outubro de 2026
+"""
+
+import io               # Para gerar a imagem em memória
+import os               # Para rotinas do sistema operacional
+import argparse         # Para tratar os parâmetros da linha de comando
+import socketserver     # Para o servidor em socket Unix
+import multiprocessing  # Para os processos que renderizam as requisições
+import urllib.parse     # Para ler os parâmetros das requisições
+
+from collections import OrderedDict  # Para o cache das cenas
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image   # Para codificar as imagens em PNG
+
+import gl               # Recupera rotinas de suporte ao X3D
+import gpu              # Simula os recursos de uma GPU
+import x3d              # Faz a leitura do arquivo X3D, gera o grafo de cena e faz traversal
+import backends         # Bibliotecas gráficas que podem desenhar a cena
+import renderizador     # Configuração e laço de renderização
+
+
+class Servidor:
+    """Renderiza requisições mantendo as cenas já lidas em um cache LRU.
+
+    Cada processo do servidor tem sua própria GPU, renderizador e cache de cenas. As cenas
+    são identificadas pelo caminho do arquivo; se a data de modificação mudou o arquivo é
+    lido novamente, substituindo a versão antiga no cache.
+    """
+
+    CACHE_SIZE = 16  # quantidade máxima de cenas mantidas por processo
+
+    atual = None  # Servidor de cada processo
+
+    def __init__(self, cache_size=CACHE_SIZE, backend="gl"):
+        """Prepara a GPU e o renderizador que serão usados por todas as requisições."""
+        self.renderizador = renderizador.Renderizador()
+        self.renderizador.backend = backend
+        self.cache_size = cache_size
+        self.scenes = OrderedDict()
+        gpu.GPU(self.renderizador.image_file, ".")
+        self.renderizador.mapping()
+
+    def scene(self, x3d_file):
+        """Retorna a cena do arquivo, lendo e guardando no cache se necessário."""
+        mtime = os.path.getmtime(x3d_file)
+        entry = self.scenes.pop(x3d_file, None)
+        if entry is not None and entry["mtime"] != mtime:
+            # Arquivo alterado: a versão antiga é descartada junto com seus buffers
+            gpu.GPU.delete_buffers(entry["buffers"])
+            entry = None
+        if entry is None:
+            # Cada cena tem seus próprios nós nomeados e buffers de geometria
+            x3d.X3DNode.named_nodes = {}
+            buffers = len(gpu.GPU.buffers)
+            scene = x3d.X3D(x3d_file)
+            scene.parse()
+            entry = {"scene": scene,
+                     "mtime": mtime,
+                     "named_nodes": x3d.X3DNode.named_nodes,
+                     "buffers": range(buffers, len(gpu.GPU.buffers))}
+        self.scenes[x3d_file] = entry  # reinserida como a mais recente
+
+        while len(self.scenes) > self.cache_size:
+            _, evicted = self.scenes.popitem(last=False)
+            gpu.GPU.delete_buffers(evicted["buffers"])
+        return entry
+
+    def render(self, request):
+        """Renderiza uma requisição retornando a imagem (bytes), largura e altura."""
+        entry = self.scene(request["scene"])
+        x3d.X3DNode.named_nodes = entry["named_nodes"]
+        gpu.GPU.path = os.path.dirname(request["scene"])
+
+        render = self.renderizador
+        render.scene = entry["scene"]
+        render.width = request["width"]
+        render.height = request["height"]
+        render.setup()  # só realoca os FrameBuffers se a resolução mudou
+        render.setup_gl()
+        gl.GL.frame_time = request["time"]
+
+        # Campos do Viewpoint sobrescritos somente nessa requisição
+        viewpoint = next(child for child in entry["scene"].scene.children
+                         if isinstance(child, x3d.Viewpoint))
+        original = {field: getattr(viewpoint, field) for field in request["viewpoint"]}
+        try:
+            for field, value in request["viewpoint"].items():
+                setattr(viewpoint, field, value)
+            if request["time"] is not None:  # eventos da animação já no instante pedido
+                entry["scene"].update()
+            image = render.render()
+        finally:
+            for field, value in original.items():
+                setattr(viewpoint, field, value)
+
+        if request["format"] == "rgb":
+            return image.tobytes(), render.width, render.height
+        buffer = io.BytesIO()
+        Image.fromarray(image, "RGB").save(buffer, "PNG")
+        return buffer.getvalue(), render.width, render.height
+
+
+def start_worker(cache_size, backend, texture_cache=None):
+    """Cria o servidor de um processo."""
+    # O cache de texturas em disco é compartilhado por todos os processos
+    gpu.GPU.TEXTURE_CACHE_DIR = texture_cache
+    Servidor.atual = Servidor(cache_size, backend)
+
+
+def render_request(request):
+    """Renderiza uma requisição no processo atual."""
+    return Servidor.atual.render(request)
+
+
+def floats(value):
+    """Converte uma lista de números separados por vírgula ou espaço."""
+    return [float(number) for number in value.replace(",", " ").split()]
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    """Trata as requisições HTTP de renderização.
+
+    GET /render?scene=<arquivo x3d>&width=<w>&height=<h>[&time=<s>][&format=png|rgb]
+                [&position=x,y,z][&orientation=x,y,z,a][&fieldOfView=<rad>]
+
+    O arquivo da cena é relativo à pasta raiz do servidor. O formato rgb retorna os bytes
+    crus (linha a linha, 3 bytes por pixel) com a resolução nos cabeçalhos X-Width e X-Height.
+    """
+
+    root = "."    # pasta com as cenas que podem ser renderizadas
+    pool = None   # processos que fazem as renderizações
+
+    def address_string(self):
+        """Endereço do cliente para o log (vazio em sockets Unix)."""
+        return self.client_address[0] if self.client_address else "unix"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Recebe uma requisição de renderização."""
+        url = urllib.parse.urlparse(self.path)
+        if url.path != "/render":
+            self.send_error(404, "Use /render")
+            return
+
+        try:
+            request = self.parse(urllib.parse.parse_qs(url.query))
+        except (KeyError, ValueError) as error:
+            self.send_error(400, "Parâmetro inválido: {0}".format(error))
+            return
+        if not os.path.isfile(request["scene"]):
+            self.send_error(404, "Cena não encontrada")
+            return
+
+        try:
+            data, width, height = RenderHandler.pool.apply(render_request, (request,))
+        except Exception as error:  # pylint: disable=broad-except
+            self.send_error(500, "Erro na renderização: {0}".format(error))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png" if request["format"] == "png"
+                         else "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Width", str(width))
+        self.send_header("X-Height", str(height))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def parse(query):
+        """Converte os parâmetros da requisição."""
+        def value(name, default=None):
+            return query[name][0] if name in query else default
+
+        # Só são aceitas cenas dentro da pasta raiz
+        root = os.path.realpath(RenderHandler.root)
+        scene = os.path.realpath(os.path.join(root, query["scene"][0]))
+        if os.path.commonpath([root, scene]) != root:
+            raise ValueError("scene fora da pasta raiz")
+
+        request = {
+            "scene": scene,
+            "width": int(value("width", renderizador.LARGURA)),
+            "height": int(value("height", renderizador.ALTURA)),
+            "time": float(value("time")) if "time" in query else None,
+            "format": value("format", "png"),
+            "viewpoint": {},
+        }
+        if request["format"] not in ("png", "rgb"):
+            raise ValueError("format deve ser png ou rgb")
+        if request["width"] <= 0 or request["height"] <= 0:
+            raise ValueError("resolução deve ser positiva")
+        if "position" in query:
+            request["viewpoint"]["position"] = floats(value("position"))
+        if "orientation" in query:
+            request["viewpoint"]["orientation"] = floats(value("orientation"))
+        if "fieldOfView" in query:
+            request["viewpoint"]["fieldOfView"] = float(value("fieldOfView"))
+        return request
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Servidor HTTP em socket Unix atendendo cada conexão em uma thread."""
+
+    daemon_threads = True
+
+
+def main():
+    """Inicia o servidor de renderização."""
+    parser = argparse.ArgumentParser(description="Servidor de renderização de cenas X3D.")
+    parser.add_argument("--host", help="endereço do servidor HTTP", default="127.0.0.1")
+    parser.add_argument("--port", help="porta do servidor HTTP", type=int, default=8000)
+    parser.add_argument("--socket", help="caminho de um socket Unix (no lugar da porta)")
+    parser.add_argument("--root", help="pasta com as cenas", default=".")
+    parser.add_argument("--workers", help="processos de renderização", type=int, default=2)
+    parser.add_argument("--cache", help="cenas mantidas por processo", type=int,
+                        default=Servidor.CACHE_SIZE)
+    parser.add_argument("--backend", help="rotinas de renderização", default="gl",
+                        choices=list(backends.BACKENDS))
+    parser.add_argument("--texture-cache", help="pasta do cache em disco das texturas decodificadas")
+    args = parser.parse_args()
+
+    RenderHandler.root = args.root
+    # Os processos são criados uma única vez e atendem todas as requisições (cache quente)
+    with multiprocessing.Pool(args.workers, initializer=start_worker,
+                              initargs=(args.cache, args.backend, args.texture_cache)) as pool:
+        RenderHandler.pool = pool
+        if args.socket:
+            if os.path.exists(args.socket):  # socket deixado por uma execução anterior
+                os.unlink(args.socket)
+            server = ThreadingUnixHTTPServer(args.socket, RenderHandler)
+            print("Servidor em: {0}".format(args.socket))
+        else:
+            server = ThreadingHTTPServer((args.host, args.port), RenderHandler)
+            print("Servidor em: http://{0}:{1}/render".format(args.host, args.port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.socket:
+                os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
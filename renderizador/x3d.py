@@ -39,6 +39,13 @@ def get_colors(appearance):
         colors["specularColor"] = appearance.material.specularColor
         colors["shininess"] = appearance.material.shininess
         colors["transparency"] = appearance.material.transparency
+        colors["ambientIntensity"] = appearance.material.ambientIntensity
+        colors["lighting"] = True  # sem Material a forma não é iluminada
+    if appearance and isinstance(appearance.texture, ImageTexture) and appearance.texture.url:
+        # Textura usada nas geometrias com coordenadas de textura
+        colors["texture"] = appearance.texture.url[0]
+        colors["repeatS"] = appearance.texture.repeatS
+        colors["repeatT"] = appearance.texture.repeatT
 
     return colors
 
@@ -243,6 +250,8 @@ class X3D:
          sistema de preview para geometrias 2D simples
     render : {} (static)
         dicionario dos métodos de renderização
+    compiler : {} (static)
+        dicionario dos métodos que compilam as geometrias em buffers da GPU
 
     Métodos
     -------
@@ -259,6 +268,7 @@ class X3D:
     current_texture = []  # controle de texturas instantâneas
     preview = None  # atributo que aponta para o sistema de preview
     renderer = {}  # dicionario dos métodos de renderização
+    compiler = {}  # dicionario dos métodos de compilação das geometrias
 
     def __init__(self, filename):
         """Constroi o atributo para a raiz do grafo X3D."""
@@ -285,6 +295,10 @@ class X3D:
         """Renderização da cena começando da raiz do X3D."""
         self.scene.render()
 
+    def update(self):
+        """Propaga os eventos da cena para o instante atual sem renderizar."""
+        self.scene.update()
+
 class Scene:
     """O nó Scene acomoda a cena X3D."""
 
@@ -339,6 +353,19 @@ class Scene:
         for child in self.children:
             child.render()
 
+    def update(self):
+        """Avalia sensores, interpoladores e ROUTEs até os eventos chegarem ao destino."""
+        # Na renderização cada ROUTE só leva o valor adiante no quadro seguinte, então uma
+        # cadeia de eventos (ex.: relógio -> interpolador -> Transform) chega atrasada alguns
+        # quadros. Avaliando a cadeia uma vez por ROUTE antes de renderizar, o quadro passa a
+        # depender somente do instante atual, como em uma renderização fora de tempo real.
+        events = [child for child in self.children
+                  if isinstance(child, (X3DSensorNode, X3DInterpolatorNode, ROUTE))]
+        routes = sum(isinstance(child, ROUTE) for child in events)
+        for _ in range(routes):
+            for child in events:
+                child.render()
+
 # Core component
 
 class X3DNode:
@@ -424,8 +451,12 @@ class X3DGroupingNode(X3DChildNode):
 class Transform(X3DGroupingNode):
     """Nó de agrupamento que define um sistema de coordenadas para seus nós filhos."""
 
+    # Campos que alteram a matriz de transformação do nó
+    TRANSFORM_FIELDS = ("rotation", "scale", "translation", "center", "scaleOrientation")
+
     def __init__(self, node):
         """Parse do nó X3d."""
+        self.cache = {"dirty": True}  # Matrizes guardadas entre os quadros pelo renderizador
         super().__init__(node) # Chama construtor da classe pai
         self.rotation = SFRotation(node, "rotation", [0, 0, 1, 0])
         self.scale = SFVec3f(node, "scale", [1, 1, 1])
@@ -433,6 +464,13 @@ class Transform(X3DGroupingNode):
         self.center = SFVec3f(node, "center", [0, 0, 0])
         self.scaleOrientation = SFRotation(node, "scaleOrientation", [0, 0, 1, 0])
 
+    def __setattr__(self, name, value):
+        """Marca as matrizes guardadas como desatualizadas quando a transformação muda."""
+        # Alterações feitas por ROUTEs (setattr) só invalidam esse nó e seus filhos
+        if name in Transform.TRANSFORM_FIELDS:
+            self.cache["dirty"] = True
+        super().__setattr__(name, value)
+
     def render(self):
         """Rotina de renderização."""
         if not all(func in X3D.renderer for func in ("Transform_in", "Transform_out")):
@@ -441,7 +479,8 @@ class Transform(X3DGroupingNode):
         # NO FUTURO MANDAR O OBJETO INTEIRO COM SEUS PARAMETROS ENCAPSULADOS
         X3D.renderer["Transform_in"](translation=self.translation,
                                      scale=self.scale,
-                                     rotation=self.rotation)
+                                     rotation=self.rotation,
+                                     cache=self.cache)
 
         for child in self.children:
             child.render()
@@ -579,8 +618,26 @@ class X3DGeometryNode(X3DNode):
 
     def __init__(self, node=None):
         """Parse do nó X3D."""
+        self.mesh = None  # Geometria compilada em buffers da GPU, se houver
         super().__init__(node)  # Chama construtor da classe pai
 
+    def __setattr__(self, name, value):
+        """Descarta a malha compilada quando um campo da geometria muda."""
+        # Alterações feitas por ROUTEs (setattr) depois da compilação fariam a malha ficar
+        # desatualizada; a geometria passa então a ser desenhada sem compilação (os buffers
+        # antigos são liberados junto com a cena)
+        if name != "mesh" and getattr(self, "mesh", None):
+            self.mesh = None
+        super().__setattr__(name, value)
+
+    def compiled(self, mesh, *properties):
+        """Retorna a malha compilada registrando-a nos nós de propriedades usados nela."""
+        # properties são os nós (Coordinate, Color, ...) cujos dados foram copiados na malha
+        for node in properties:
+            if node:
+                node.geometries.append(self)
+        return mesh
+
 
 class X3DComposedGeometryNode(X3DGeometryNode):
     """Este é o tipo de nó base para toda a geometria 3D composta em X3D."""
@@ -604,8 +661,17 @@ class X3DGeometricPropertyNode(X3DNode):
 
     def __init__(self, node=None):
         """Parse do nó X3D."""
+        self.geometries = []  # Geometrias compiladas com os dados desse nó
         super().__init__(node)  # Chama construtor da classe pai
 
+    def __setattr__(self, name, value):
+        """Descarta as malhas compiladas das geometrias que usam esse nó quando ele muda."""
+        # Ex.: um ROUTE para o campo point de um Coordinate com DEF
+        if name != "geometries":
+            for geometry in getattr(self, "geometries", ()):
+                geometry.mesh = None
+        super().__setattr__(name, value)
+
 
 class X3DCoordinateNode(X3DGeometricPropertyNode):
     """Nó base para todos os tipos de nós de coordenadas em X3D."""
@@ -649,6 +715,13 @@ class TriangleSet(X3DComposedGeometryNode):
         super().__init__(node) # Chama construtor da classe pai
         self.vertices = MFVec2f(node, "vertices", [])
 
+        # Compila a geometria uma única vez em buffers da GPU (desenhada sem compilação se um
+        # campo mudar depois, ver X3DGeometryNode)
+        if "TriangleSet" in X3D.compiler and self.coord and self.coord.point:
+            self.mesh = self.compiled(X3D.compiler["TriangleSet"](point=self.coord.point,
+                                                                  ccw=self.ccw, solid=self.solid),
+                                      self.coord)
+
         # Preview
         # Implemente se desejar
 
@@ -658,9 +731,12 @@ class TriangleSet(X3DComposedGeometryNode):
             raise Exception("TriangleSet não foi implementado.")
 
         colors = get_colors(appearance)
-        if self.coord and self.coord.point:
+        if self.mesh:
+            X3D.renderer["Mesh"](mesh=self.mesh, colors=colors)
+        elif self.coord and self.coord.point:
             # NO FUTURO MANDAR O OBJETO INTEIRO COM SEUS PARAMETROS ENCAPSULADOS
-            X3D.renderer["TriangleSet"](point=self.coord.point, colors=colors)
+            X3D.renderer["TriangleSet"](point=self.coord.point, colors=colors,
+                                        ccw=self.ccw, solid=self.solid)
 
 class TriangleStripSet(X3DComposedGeometryNode):
     """Representa uma forma 3D composta por faixas de triângulos."""
@@ -670,6 +746,14 @@ class TriangleStripSet(X3DComposedGeometryNode):
         super().__init__(node) # Chama construtor da classe pai
         self.stripCount = MFInt32(node, "stripCount", [])
 
+        # Compila a geometria uma única vez em buffers da GPU (desenhada sem compilação se um
+        # campo mudar depois, ver X3DGeometryNode)
+        if "TriangleStripSet" in X3D.compiler and self.coord and self.coord.point and self.stripCount:
+            self.mesh = self.compiled(X3D.compiler["TriangleStripSet"](point=self.coord.point,
+                                                                       stripCount=self.stripCount,
+                                                                       ccw=self.ccw, solid=self.solid),
+                                      self.coord)
+
         # Preview
         # Implemente se desejar
 
@@ -679,11 +763,14 @@ class TriangleStripSet(X3DComposedGeometryNode):
             raise Exception("TriangleStripSet não foi implementado.")
 
         colors = get_colors(appearance)
-        if self.coord and self.coord.point and self.stripCount:
+        if self.mesh:
+            X3D.renderer["Mesh"](mesh=self.mesh, colors=colors)
+        elif self.coord and self.coord.point and self.stripCount:
             # NO FUTURO MANDAR O OBJETO INTEIRO COM SEUS PARAMETROS ENCAPSULADOS
             X3D.renderer["TriangleStripSet"](point=self.coord.point,
                                              stripCount=self.stripCount,
-                                             colors=colors)
+                                             colors=colors,
+                                             ccw=self.ccw, solid=self.solid)
 
 class IndexedTriangleStripSet(X3DComposedGeometryNode):
     """Representa uma forma 3D composta de tiras de triângulos."""
@@ -693,6 +780,14 @@ class IndexedTriangleStripSet(X3DComposedGeometryNode):
         super().__init__(node) # Chama construtor da classe pai
         self.index = MFInt32(node, "index", [])
 
+        # Compila a geometria uma única vez em buffers da GPU (desenhada sem compilação se um
+        # campo mudar depois, ver X3DGeometryNode)
+        if "IndexedTriangleStripSet" in X3D.compiler and self.coord and self.coord.point and self.index:
+            self.mesh = self.compiled(X3D.compiler["IndexedTriangleStripSet"](point=self.coord.point,
+                                                                              index=self.index,
+                                                                              ccw=self.ccw, solid=self.solid),
+                                      self.coord)
+
         # Preview
         # Implemente se desejar
 
@@ -702,12 +797,15 @@ class IndexedTriangleStripSet(X3DComposedGeometryNode):
             raise Exception("IndexedTriangleStripSet não foi implementado.")
 
         colors = get_colors(appearance)
-        if "IndexedTriangleStripSet" in X3D.renderer:
+        if self.mesh:
+            X3D.renderer["Mesh"](mesh=self.mesh, colors=colors)
+        elif "IndexedTriangleStripSet" in X3D.renderer:
             if self.coord and self.coord.point and self.index:
                 # NO FUTURO MANDAR O OBJETO INTEIRO COM SEUS PARAMETROS ENCAPSULADOS
                 X3D.renderer["IndexedTriangleStripSet"](point=self.coord.point,
                                                         index=self.index,
-                                                        colors=colors)
+                                                        colors=colors,
+                                                        ccw=self.ccw, solid=self.solid)
 
 
 # Geometry2D component
@@ -850,6 +948,12 @@ class Box(X3DGeometryNode):
         """Parse do nó X3D."""
         super().__init__(node) # Chama construtor da classe pai
         self.size = SFVec3f(node, "size", [2, 2, 2])
+        self.solid = SFBool(node, "solid", True)
+
+        # Compila a geometria uma única vez em buffers da GPU (desenhada sem compilação se um
+        # campo mudar depois, ver X3DGeometryNode)
+        if "Box" in X3D.compiler and self.size:
+            self.mesh = X3D.compiler["Box"](size=self.size, solid=self.solid)
 
     def render(self, appearance=None):
         """Rotina de renderização."""
@@ -857,8 +961,10 @@ class Box(X3DGeometryNode):
             raise Exception("Box não foi implementado.")
 
         colors = get_colors(appearance)
-        if self.size:
-            X3D.renderer["Box"](size=self.size, colors=colors)
+        if self.mesh:
+            X3D.renderer["Mesh"](mesh=self.mesh, colors=colors)
+        elif self.size:
+            X3D.renderer["Box"](size=self.size, colors=colors, solid=self.solid)
 
 
 class Sphere(X3DGeometryNode):
@@ -868,6 +974,12 @@ class Sphere(X3DGeometryNode):
         """Parse do nó X3D."""
         super().__init__(node) # Chama construtor da classe pai
         self.radius = SFFloat(node, "radius", 1)
+        self.solid = SFBool(node, "solid", True)
+
+        # Compila a geometria uma única vez em buffers da GPU (desenhada sem compilação se um
+        # campo mudar depois, ver X3DGeometryNode)
+        if "Sphere" in X3D.compiler and self.radius:
+            self.mesh = X3D.compiler["Sphere"](radius=self.radius, solid=self.solid)
 
     def render(self, appearance=None):
         """Rotina de renderização."""
@@ -875,8 +987,10 @@ class Sphere(X3DGeometryNode):
             raise Exception("Sphere não foi implementado.")
 
         colors = get_colors(appearance)
-        if self.radius:
-            X3D.renderer["Sphere"](radius=self.radius, colors=colors)
+        if self.mesh:
+            X3D.renderer["Mesh"](mesh=self.mesh, colors=colors)
+        elif self.radius:
+            X3D.renderer["Sphere"](radius=self.radius, colors=colors, solid=self.solid)
 
 
 class IndexedFaceSet(X3DComposedGeometryNode):
@@ -889,12 +1003,30 @@ class IndexedFaceSet(X3DComposedGeometryNode):
         self.coordIndex = MFInt32(node, "coordIndex", [])
         self.colorIndex = MFInt32(node, "colorIndex", [])
         self.texCoordIndex = MFInt32(node, "texCoordIndex", [])
+        self.creaseAngle = SFFloat(node, "creaseAngle", 0)
+
+        # Compila a geometria uma única vez em buffers da GPU (desenhada sem compilação se um
+        # campo mudar depois, ver X3DGeometryNode)
+        if "IndexedFaceSet" in X3D.compiler and self.coord and self.coordIndex:
+            self.mesh = self.compiled(X3D.compiler["IndexedFaceSet"](
+                coord=self.coord.point,
+                coordIndex=self.coordIndex,
+                color=self.color.color if self.color else None,
+                colorIndex=self.colorIndex,
+                ccw=self.ccw, solid=self.solid,
+                texCoord=self.texCoord.point if self.texCoord else None,
+                texCoordIndex=self.texCoordIndex,
+                creaseAngle=self.creaseAngle), self.coord, self.color, self.texCoord)
 
     def render(self, appearance=None):
         """Rotina de renderização."""
         if "IndexedFaceSet" not in X3D.renderer:
             raise Exception("IndexedFaceSet não foi implementado.")
 
+        if self.mesh:
+            X3D.renderer["Mesh"](mesh=self.mesh, colors=get_colors(appearance))
+            return
+
         ret_coord = None
         ret_color = None
         ret_texCoord = None
@@ -914,7 +1046,8 @@ class IndexedFaceSet(X3DComposedGeometryNode):
                                            colorIndex=self.colorIndex, texCoord=ret_texCoord,
                                            texCoordIndex=self.texCoordIndex,
                                            colors=colors,
-                                           current_texture=X3D.current_texture)
+                                           current_texture=X3D.current_texture,
+                                           ccw=self.ccw, solid=self.solid)
 
 
 # Lighting component
@@ -943,6 +1076,8 @@ class DirectionalLight(X3DLightNode):
         """Rotina de renderização."""
         if "DirectionalLight" not in X3D.renderer:
             raise Exception("DirectionalLight não foi implementado.")
+        if not self.on:
+            return
 
         X3D.renderer["DirectionalLight"](ambientIntensity=self.ambientIntensity,
                                          color=self.color,
@@ -957,16 +1092,22 @@ class PointLight(X3DLightNode):
         """Parse do nó X3D."""
         super().__init__(node) # Chama construtor da classe pai
         self.location = SFVec3f(node, "location", [0.0, 0.0, 0.0])
+        self.attenuation = SFVec3f(node, "attenuation", [1.0, 0.0, 0.0])
+        self.radius = SFFloat(node, "radius", 100)
 
     def render(self):
         """Rotina de renderização."""
         if "PointLight" not in X3D.renderer:
             raise Exception("PointLight não foi implementado.")
+        if not self.on:
+            return
 
         X3D.renderer["PointLight"](ambientIntensity=self.ambientIntensity,
                                    color=self.color,
                                    intensity=self.intensity,
-                                   location=self.location)
+                                   location=self.location,
+                                   attenuation=self.attenuation,
+                                   radius=self.radius)
 
 
 # Texturing component